@@ -0,0 +1,112 @@
+## Benchmark: shared, tuned boto3 clients vs botocore defaults
+# Concurrent knowledge base Retrieve calls against a local stub of the bedrock-agent-runtime
+# endpoint. Nothing leaves the machine; dummy credentials are used for request signing.
+#
+#   python benchmarks/bench_aws_clients.py
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+
+import fakes  # noqa: F401  (puts src/agent on the path)
+from aws_clients import AWSClientFactory
+
+THREADS = 32
+REQUESTS = 640
+SERVER_LATENCY = 0.1
+REGION = "eu-central-1"
+
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+
+RESPONSE = json.dumps({"retrievalResults": [
+    {"content": {"text": "passage"}, "location": {"type": "CUSTOM", "customDocumentLocation": {"id": "doc-1"}}, "score": 0.7}
+]}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real endpoint
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StubHandler.lock:
+            StubHandler.connections += 1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(SERVER_LATENCY)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):
+        pass
+
+
+class DiscardCounter(logging.Handler):
+    """Counts urllib3 "Connection pool is full, discarding connection" warnings."""
+    discarded = 0
+
+    def emit(self, record):
+        DiscardCounter.discarded += 1
+
+
+def call(client):
+    client.retrieve(knowledgeBaseId="KBSTUB1234", retrievalQuery={"text": "vpn"},
+                    retrievalConfiguration={"vectorSearchConfiguration": {"numberOfResults": 5}})
+
+
+def run(name: str, get_client):
+    call(get_client())  # one-time service model loading is not what is measured here
+    StubHandler.connections = 0
+    DiscardCounter.discarded = 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        list(pool.map(lambda _: call(get_client()), range(REQUESTS)))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<48} {REQUESTS / elapsed:7.0f} req/s  {elapsed * 1000 / REQUESTS * THREADS:6.1f} ms/call  "
+          f"{StubHandler.connections:4d} new connections  {DiscardCounter.discarded:4d} discarded")
+
+
+def main():
+    pool_logger = logging.getLogger("urllib3.connectionpool")
+    pool_logger.addHandler(DiscardCounter())
+    pool_logger.propagate = False
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"{THREADS} threads, {REQUESTS} Retrieve calls, stub latency {SERVER_LATENCY * 1000:.0f} ms")
+
+    # what strands_tools.retrieve does: a new client, and new connections, per call
+    session_lock = threading.Lock()
+
+    def per_call_client():
+        with session_lock:  # boto3.client() shares the default session, which is not thread safe
+            return boto3.client("bedrock-agent-runtime", region_name=REGION, endpoint_url=endpoint)
+
+    run("client per call (botocore defaults)", per_call_client)
+
+    shared_default = boto3.client("bedrock-agent-runtime", region_name=REGION, endpoint_url=endpoint)
+    run("shared client, botocore defaults (pool 10)", lambda: shared_default)
+
+    factory = AWSClientFactory(max_pool_connections=50)
+    run("AWSClientFactory client (pool 50, adaptive)",
+        lambda: factory.client("bedrock-agent-runtime", region_name=REGION, endpoint_url=endpoint))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
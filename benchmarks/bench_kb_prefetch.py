@@ -0,0 +1,59 @@
+## Benchmark: speculative KB retrieval started with the first model call
+# Turns where the model first asks for `retrieve` and then answers, with and without prefetch.
+# The model's time to first token and the retrieve latency are simulated.
+#
+#   python benchmarks/bench_kb_prefetch.py
+
+import asyncio
+import time
+
+from fakes import FAKE_LATENCY, ScriptedModel, agent_with, fake_retrieve
+from kb_prefetch import KBPrefetcher
+from tool_execution import ToolClassLimit, ToolConcurrencyLimiter
+
+MODEL_LATENCY = 0.6
+TURNS = 5
+QUESTION = "How do I request access to the staging VPN?"
+
+
+async def run_turns(prefetch: bool, model_query: str):
+    limiter = ToolConcurrencyLimiter({"kb": ToolClassLimit(max_concurrency=8)})
+    limiter.install(asyncio.get_running_loop())
+    prefetcher = KBPrefetcher()
+    script = [[{"toolUse": {"name": "retrieve", "input": {"text": model_query}}}], [{"text": "You request it from the IT portal."}]]
+    agent = agent_with(ScriptedModel(script, first_token_latency=MODEL_LATENCY), [fake_retrieve], hooks=[prefetcher, limiter])
+
+    answer_ttfts, turn_times = [], []
+    for _ in range(TURNS):
+        started = time.perf_counter()
+        kb_prefetch = prefetcher.start(agent, QUESTION) if prefetch else None
+        first_answer = None
+        try:
+            async for event in agent.stream_async(QUESTION, kb_prefetch=kb_prefetch):
+                if "data" in event and first_answer is None:
+                    first_answer = time.perf_counter() - started
+        finally:
+            prefetcher.finish(kb_prefetch)
+        answer_ttfts.append(first_answer)
+        turn_times.append(time.perf_counter() - started)
+    return sum(answer_ttfts) / TURNS, sum(turn_times) / TURNS, prefetcher.stats()
+
+
+def scenario(name: str, prefetch: bool, model_query: str):
+    ttft, turn, stats = asyncio.run(run_turns(prefetch, model_query))
+    line = f"{name:<40} answer TTFT {ttft * 1000:6.0f} ms  turn {turn * 1000:6.0f} ms"
+    if prefetch:
+        line += f"  hit rate {stats['hit_rate']:.0%}  saved/hit {stats['ttft_saved_seconds_per_hit'] or 0:.3f} s"
+    print(line)
+
+
+def main():
+    print(f"model TTFT {MODEL_LATENCY}s per call, retrieve {FAKE_LATENCY['retrieve']}s, {TURNS} turns each")
+    scenario("no prefetch", False, QUESTION)
+    scenario("prefetch, model keeps the query", True, QUESTION)
+    scenario("prefetch, model keeps it (case/punct)", True, QUESTION.lower().rstrip("?"))
+    scenario("prefetch, model rewrites the query", True, "staging VPN access request process")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+## Benchmark: bounded parallel tool execution within one cycle
+# One turn in which the model asks for several `retrieve` and `confluence_get_page` calls at once,
+# run with fake tool latencies (see fakes.FAKE_LATENCY) under different limits.
+#
+#   python benchmarks/bench_tool_concurrency.py
+
+import asyncio
+import time
+
+from fakes import FAKE_LATENCY, ScriptedModel, agent_with, fake_confluence_get_page, fake_retrieve
+from tool_execution import ToolClassLimit, ToolConcurrencyLimiter
+
+TOOL_NAMES = ["retrieve", "confluence_get_page"]
+
+
+def fan_out_script(retrieves: int, pages: int):
+    tool_uses = [{"toolUse": {"name": "retrieve", "input": {"text": f"query {i}"}}} for i in range(retrieves)]
+    tool_uses += [{"toolUse": {"name": "confluence_get_page", "input": {"page_id": str(100 + i)}}} for i in range(pages)]
+    return [tool_uses, [{"text": "Here is the answer."}]]
+
+
+async def run_turn(limiter: ToolConcurrencyLimiter, retrieves: int, pages: int):
+    limiter.install(asyncio.get_running_loop())
+    agent = agent_with(ScriptedModel(fan_out_script(retrieves, pages)), [fake_retrieve, fake_confluence_get_page], hooks=[limiter])
+
+    timeline = []
+    started = time.perf_counter()
+    async for event in agent.stream_async("benchmark question"):
+        if "tool_status" in event and event["tool_status"]["finished_at"]:
+            status = event["tool_status"]
+            timeline.append((status["tool_name"], status["state"], status["started_at"], status["finished_at"]))
+    return time.perf_counter() - started, timeline
+
+
+def scenario(name: str, limiter: ToolConcurrencyLimiter, retrieves: int, pages: int, show_timeline: bool = False):
+    elapsed, timeline = asyncio.run(run_turn(limiter, retrieves, pages))
+    states = {}
+    for _, state, _, _ in timeline:
+        states[state] = states.get(state, 0) + 1
+    print(f"{name:<44} {retrieves} kb + {pages} mcp calls  turn {elapsed * 1000:7.0f} ms  {states}")
+    if show_timeline and timeline:
+        origin = min(t[2] for t in timeline)
+        for tool_name, state, start, finish in sorted(timeline, key=lambda t: t[2]):
+            print(f"    {tool_name:<22} {state:<8} start +{(start - origin) * 1000:5.0f} ms  finish +{(finish - origin) * 1000:5.0f} ms")
+
+
+def main():
+    print(f"fake latencies: {FAKE_LATENCY}")
+    serial = {name: "default" for name in TOOL_NAMES}
+
+    scenario("serial (every call waits on the previous)",
+             ToolConcurrencyLimiter({"default": ToolClassLimit(max_concurrency=1)}, tool_classes=serial), 1, 3)
+    scenario("bounded (kb=8, mcp=2)",
+             ToolConcurrencyLimiter({"kb": ToolClassLimit(max_concurrency=8), "mcp": ToolClassLimit(max_concurrency=2)},
+                                    tool_classes={"confluence_get_page": "mcp"}), 1, 3, show_timeline=True)
+    scenario("bounded (kb=8, mcp=4)",
+             ToolConcurrencyLimiter({"kb": ToolClassLimit(max_concurrency=8), "mcp": ToolClassLimit(max_concurrency=4)},
+                                    tool_classes={"confluence_get_page": "mcp"}), 1, 3)
+
+    # sync tools run on the executor, so its size caps kb fan-out too
+    scenario("kb fan-out, 2 executor threads",
+             ToolConcurrencyLimiter({"kb": ToolClassLimit(max_concurrency=8)}, executor_workers=2), 6, 0)
+    scenario("kb fan-out, 16 executor threads",
+             ToolConcurrencyLimiter({"kb": ToolClassLimit(max_concurrency=8)}, executor_workers=16), 6, 0)
+
+    # a slow class times out with a structured error instead of stalling the turn
+    scenario("mcp timeout 0.5 s",
+             ToolConcurrencyLimiter({"mcp": ToolClassLimit(max_concurrency=2, timeout_seconds=0.5)},
+                                    tool_classes={"confluence_get_page": "mcp"}), 1, 3, show_timeline=True)
+
+
+if __name__ == "__main__":
+    main()
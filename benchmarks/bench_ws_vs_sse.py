@@ -0,0 +1,175 @@
+## Benchmark: multiplexed /ws vs one SSE response per turn
+# A local uvicorn server exposes both transports over the same per-session agents (scripted
+# model, no AWS). Several sessions chat concurrently, a few turns each, like a dashboard that
+# watches many conversations. The server counts the TCP connections it accepts.
+#
+#   python benchmarks/bench_ws_vs_sse.py
+
+import asyncio
+import json
+import threading
+import time
+
+import httpx
+import uvicorn
+import websockets
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from fakes import ScriptedModel, agent_with
+from chat_events import to_chat_event
+from ws_chat import serve_chat_socket
+
+SESSIONS = 8
+TURNS = 5
+ANSWER = " ".join(["token"] * 60)  # 60 message events per turn
+
+
+## server: the same agent_turn shape as src/agent/app.py
+agents = {}
+agent_locks = {}
+
+
+async def agent_turn(session_id, message, prefetch_kb=None):
+    if session_id not in agents:
+        agents[session_id] = agent_with(ScriptedModel([[{"text": ANSWER}]]), [])
+        agent_locks[session_id] = asyncio.Lock()
+    async with agent_locks[session_id]:
+        async for event in agents[session_id].stream_async(message):
+            chat_event = to_chat_event(event)
+            if chat_event is not None:
+                yield chat_event
+
+
+class ChatRequest(BaseModel):
+    query: str
+    session_id: str = "test"
+
+
+app = FastAPI()
+
+
+@app.post("/stream_chat")
+async def chat_endpoint(request: ChatRequest):
+    async def stream_response():
+        async for chat_event in agent_turn(request.session_id, request.query):
+            yield chat_event.serialize()
+    return StreamingResponse(stream_response(), media_type="text/event-stream")
+
+
+@app.websocket("/ws")
+async def ws_endpoint(websocket: WebSocket):
+    await serve_chat_socket(websocket, agent_turn)
+
+
+class CountingSet(set):
+    """uvicorn keeps the protocol of every open connection in a set; count the adds.
+
+    A websocket upgrade adds a second (websocket) protocol for the same TCP connection,
+    so only http protocols count as new connections.
+    """
+    opened = 0
+    peak = 0
+
+    def add(self, item):
+        super().add(item)
+        if "WebSocket" not in type(item).__name__:
+            CountingSet.opened += 1
+        CountingSet.peak = max(CountingSet.peak, sum("WebSocket" not in type(p).__name__ for p in self))
+
+    @classmethod
+    def reset(cls):
+        cls.opened = cls.peak = 0
+
+
+## clients
+async def sse_turn(client: httpx.AsyncClient, session_id: str, query: str) -> int:
+    events = 0
+    async with client.stream("POST", "/stream_chat", json={"query": query, "session_id": session_id}) as response:
+        async for line in response.aiter_lines():
+            events += line.startswith("event: ")
+    return events
+
+
+async def sse_sessions(base_url: str, reuse_connection: bool):
+    latencies = []
+    shared = httpx.AsyncClient(base_url=base_url, timeout=30) if reuse_connection else None
+
+    async def session(n: int):
+        for turn in range(TURNS):
+            started = time.perf_counter()
+            if shared:
+                await sse_turn(shared, f"sse-{n}", f"question {turn}")
+            else:
+                # what src/ui/app.py does: a fresh requests.post (and connection) per turn
+                async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+                    await sse_turn(client, f"sse-{n}", f"question {turn}")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(session(n) for n in range(SESSIONS)))
+    if shared:
+        await shared.aclose()
+    return latencies
+
+
+async def ws_sessions(base_url: str):
+    latencies = []
+    async with websockets.connect(base_url.replace("http", "ws") + "/ws") as ws:
+        waiters = {}
+
+        async def reader():
+            async for raw in ws:
+                frame = json.loads(raw)
+                if frame["type"] in ("done", "error", "cancelled"):
+                    waiters.pop(frame["request_id"]).set_result(frame["type"])
+
+        reader_task = asyncio.create_task(reader())
+
+        async def session(n: int):
+            for turn in range(TURNS):
+                request_id = f"ws-{n}-{turn}"
+                waiters[request_id] = asyncio.get_running_loop().create_future()
+                started = time.perf_counter()
+                await ws.send(json.dumps({"type": "chat", "request_id": request_id, "session_id": f"ws-{n}",
+                                          "query": f"question {turn}"}))
+                await waiters[request_id]
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(session(n) for n in range(SESSIONS)))
+        reader_task.cancel()
+    return latencies
+
+
+def report(name: str, latencies, elapsed: float):
+    latencies = sorted(latencies)
+    print(f"{name:<34} {len(latencies):3d} turns in {elapsed:5.2f} s  per turn mean {sum(latencies) / len(latencies) * 1000:6.1f} ms"
+          f"  p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.1f} ms  connections opened {CountingSet.opened:3d}  peak open {CountingSet.peak:2d}")
+
+
+def main():
+    config = uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning", ws="websockets")
+    server = uvicorn.Server(config)
+    server.server_state.connections = CountingSet()
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    base_url = f"http://127.0.0.1:{port}"
+    print(f"{SESSIONS} concurrent sessions x {TURNS} turns, {len(ANSWER.split())} message events per turn")
+
+    for name, scenario in [
+        ("SSE, new connection per turn", lambda: sse_sessions(base_url, reuse_connection=False)),
+        ("SSE, keep-alive client", lambda: sse_sessions(base_url, reuse_connection=True)),
+        ("/ws, one multiplexed socket", lambda: ws_sessions(base_url)),
+    ]:
+        CountingSet.reset()
+        started = time.perf_counter()
+        latencies = asyncio.run(scenario())
+        report(name, latencies, time.perf_counter() - started)
+
+    server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
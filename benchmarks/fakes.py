@@ -0,0 +1,104 @@
+## Offline stand-ins for the model and tools used by the benchmarks
+# Nothing here talks to AWS or Confluence. Latencies are simulated with sleeps.
+
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, AsyncIterable, Dict, List, Optional
+
+from strands import tool
+from strands.models import Model
+
+# benchmarks import the agent helper modules the same way src/agent/app.py does
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "agent"))
+
+
+class ScriptedModel(Model):
+    """Model that replays a fixed list of responses, one per model call.
+
+    Each response is a list of content items: `{"text": "..."}` or
+    `{"toolUse": {"name": ..., "input": {...}}}`. `first_token_latency` is slept
+    before the first chunk of every response to mimic time to first token.
+    """
+
+    def __init__(self, responses: List[List[Dict[str, Any]]], first_token_latency: float = 0.0):
+        self.responses = responses
+        self.first_token_latency = first_token_latency
+        self.calls = 0
+        self.config: Dict[str, Any] = {"model_id": "scripted"}
+
+    def update_config(self, **model_config: Any) -> None:
+        self.config.update(model_config)
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs: Any) -> AsyncIterable[Dict[str, Any]]:
+        response = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        await asyncio.sleep(self.first_token_latency)
+
+        yield {"messageStart": {"role": "assistant"}}
+        stop_reason = "end_turn"
+        for index, item in enumerate(response):
+            if "toolUse" in item:
+                stop_reason = "tool_use"
+                tool_use_id = f"tooluse_{self.calls}_{index}"
+                yield {"contentBlockStart": {"start": {"toolUse": {"toolUseId": tool_use_id, "name": item["toolUse"]["name"]}}}}
+                yield {"contentBlockDelta": {"delta": {"toolUse": {"input": json.dumps(item["toolUse"]["input"])}}}}
+            else:
+                yield {"contentBlockStart": {"start": {}}}
+                for word in item["text"].split(" "):
+                    yield {"contentBlockDelta": {"delta": {"text": word + " "}}}
+            yield {"contentBlockStop": {}}
+        yield {"messageStop": {"stopReason": stop_reason}}
+        yield {"metadata": {"usage": {"inputTokens": 0, "outputTokens": 0, "totalTokens": 0}, "metrics": {"latencyMs": 0}}}
+
+
+## fake tools. they keep the names and result shapes of the real ones.
+FAKE_LATENCY = {"retrieve": 0.4, "confluence_get_page": 0.8}
+
+
+@tool(name="retrieve")
+def fake_retrieve(text: str) -> Dict[str, Any]:
+    """Retrieve knowledge base passages for the query.
+
+    Args:
+        text: The query to search for.
+    """
+    time.sleep(FAKE_LATENCY["retrieve"])
+    return {"status": "success", "content": [{"text": f"Retrieved 3 results for: {text}\n\nScore: 0.71\nContent: passage about {text}"}]}
+
+
+@tool(name="confluence_get_page")
+async def fake_confluence_get_page(page_id: str) -> Dict[str, Any]:
+    """Get a confluence page by id.
+
+    Args:
+        page_id: The confluence page id.
+    """
+    await asyncio.sleep(FAKE_LATENCY["confluence_get_page"])
+    page = {"metadata": {"id": page_id, "title": f"Page {page_id}", "url": f"https://example.atlassian.net/wiki/pages/{page_id}"},
+            "content": {"value": f"Body of page {page_id}"}}
+    return {"status": "success", "content": [{"text": json.dumps(page)}]}
+
+
+def agent_with(model: Model, tools: list, hooks: Optional[list] = None):
+    """Build an agent wired like src/agent/app.py, minus sessions and AWS."""
+    from strands import Agent
+    from strands.agent.conversation_manager import SlidingWindowConversationManager
+
+    return Agent(
+        model=model,
+        system_prompt="benchmark",
+        conversation_manager=SlidingWindowConversationManager(window_size=30, should_truncate_results=True),
+        callback_handler=None,
+        tools=tools,
+        hooks=hooks or [],
+    )
@@ -0,0 +1,162 @@
+## Replay recorded agent turns through /stream_chat
+# Turns recorded with TURN_RECORD_DIR set are played back through the real chat_endpoint, with
+# the model stream and tool results served from the traces (no AWS, no Confluence). For every
+# trace it checks that the SSE output matches the recording and measures CPU time and peak
+# Python memory of the turn. With --baseline the numbers are compared against an earlier run.
+#
+#   TURN_RECORD_DIR=traces python src/agent/app.py         # record some turns
+#   python benchmarks/replay_turns.py traces                 # replay without waiting
+#   python benchmarks/replay_turns.py traces --time-scale 1  # replay with recorded timing
+#   python benchmarks/replay_turns.py traces --baseline replay_baseline.json [--update-baseline]
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, "src", "agent"))
+
+
+def parse_sse(lines) -> List[List[Any]]:
+    events, name = [], None
+    for line in lines:
+        if line.startswith("event: "):
+            name = line[len("event: "):]
+        elif line.startswith("data: "):
+            events.append([name, json.loads(line[len("data: "):])])
+    return events
+
+
+def normalize(events) -> Dict[str, Any]:
+    """What must not change between runs: message text in order and each tool call's states and inputs.
+
+    Cycle ids are random and timestamps differ, and parallel tool calls may interleave differently.
+    """
+    messages, tool_calls = [], {}
+    for name, data in events:
+        if name == "message":
+            messages.append(data["message"])
+        elif name == "tool":
+            tool_input = dict(data["tool_input"])
+            state = tool_input.pop("state", None)
+            calls = tool_calls.setdefault(data["toolUseId"], [])
+            if not calls or calls[-1] != [data["tool_name"], state, tool_input]:
+                calls.append([data["tool_name"], state, tool_input])
+    return {"messages": "".join(messages), "tool_calls": tool_calls}
+
+
+def first_difference(expected: Dict[str, Any], actual: Dict[str, Any]) -> str:
+    if expected["messages"] != actual["messages"]:
+        at = next((i for i, (a, b) in enumerate(zip(expected["messages"], actual["messages"])) if a != b),
+                  min(len(expected["messages"]), len(actual["messages"])))
+        return f"message text differs at char {at}: {expected['messages'][at:at + 40]!r} vs {actual['messages'][at:at + 40]!r}"
+    for tool_use_id in sorted(set(expected["tool_calls"]) | set(actual["tool_calls"])):
+        if expected["tool_calls"].get(tool_use_id) != actual["tool_calls"].get(tool_use_id):
+            return f"tool call {tool_use_id}: {expected['tool_calls'].get(tool_use_id)} vs {actual['tool_calls'].get(tool_use_id)}"
+    return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded agent turns through /stream_chat")
+    parser.add_argument("traces", help="directory with recorded .json.gz traces")
+    parser.add_argument("--time-scale", type=float, default=0.0, help="1 = recorded timing, 0 = no waiting (default)")
+    parser.add_argument("--repeat", type=int, default=3, help="replays per trace; CPU time is the median")
+    parser.add_argument("--baseline", help="json file with the numbers of an earlier run")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run's numbers to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed CPU / memory growth over the baseline")
+    args = parser.parse_args()
+
+    # app.py reads its prompt relative to the repo root and switches to replay mode on import
+    os.environ["TURN_REPLAY_DIR"] = os.path.abspath(args.traces)
+    os.environ.pop("TURN_RECORD_DIR", None)
+    os.chdir(REPO_ROOT)
+    import app
+    from fastapi.testclient import TestClient
+
+    app.turn_replayer.time_scale = args.time_scale
+    traces = app.turn_replayer.traces
+    if not traces:
+        sys.exit(f"no completed traces in {args.traces}")
+
+    results = {trace["file"]: {"cpu_ms": [], "wall_ms": [], "output_ok": True, "difference": ""} for trace in traces}
+
+    def replay(client: TestClient, trace: Dict[str, Any], session_prefix: str):
+        body = {"query": trace["query"], "session_id": f"{session_prefix}-{trace['session_id']}", "prefetch_kb": trace["prefetch_kb"]}
+        with client.stream("POST", "/stream_chat", json=body) as response:
+            return parse_sse(response.iter_lines())
+
+    with TestClient(app.app) as client:
+        for run in range(args.repeat):
+            app.turn_replayer.reset()
+            for trace in traces:
+                result = results[trace["file"]]
+                cpu_started, wall_started = time.process_time(), time.perf_counter()
+                events = replay(client, trace, f"replay{run}")
+                result["cpu_ms"].append((time.process_time() - cpu_started) * 1000)
+                result["wall_ms"].append((time.perf_counter() - wall_started) * 1000)
+
+                difference = first_difference(normalize([o[1:] for o in trace["output"]]), normalize(events))
+                if difference:
+                    result["output_ok"] = False
+                    result["difference"] = difference
+
+        # separate pass: tracemalloc slows everything down, so it is kept out of the CPU numbers
+        app.turn_replayer.reset()
+        tracemalloc.start()
+        for trace in traces:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            replay(client, trace, "memory")
+            results[trace["file"]]["peak_kib"] = (tracemalloc.get_traced_memory()[1] - base) / 1024
+        tracemalloc.stop()
+    shutil.rmtree(app.session_storage_dir, ignore_errors=True)
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            saved = json.load(f)
+        if saved["time_scale"] == args.time_scale:
+            baseline = saved["traces"]
+        else:
+            # waiting costs cpu too, so only runs with the same time scale are comparable
+            print(f"baseline was taken with time scale {saved['time_scale']}, not comparing")
+
+    failures = 0
+    print(f"{len(traces)} traces, {args.repeat} runs each, time scale {args.time_scale}")
+    print(f"{'trace':<48} {'sse':>4} {'cpu ms':>8} {'wall ms':>8} {'recorded ms':>11} {'peak KiB':>9}")
+    summary = {}
+    for trace in traces:
+        result = results[trace["file"]]
+        cpu_ms = statistics.median(result["cpu_ms"])
+        summary[trace["file"]] = {"cpu_ms": round(cpu_ms, 2), "peak_kib": round(result["peak_kib"], 1)}
+        notes = []
+        if not result["output_ok"]:
+            notes.append(result["difference"])
+        if trace["file"] in baseline:
+            for metric, value in summary[trace["file"]].items():
+                limit = baseline[trace["file"]][metric] * (1 + args.tolerance)
+                if value > limit:
+                    notes.append(f"{metric} {value} > baseline {baseline[trace['file']][metric]} (+{args.tolerance:.0%})")
+        failures += bool(notes)
+        print(f"{trace['file']:<48} {'ok' if result['output_ok'] else 'DIFF':>4} {cpu_ms:8.1f} {statistics.median(result['wall_ms']):8.1f}"
+              f" {trace.get('duration_ms', 0):11.1f} {result['peak_kib']:9.1f}")
+        for note in notes:
+            print(f"    {note}")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"time_scale": args.time_scale, "traces": summary}, f, indent=2)
+        print(f"baseline written to {args.baseline}")
+
+    print(f"{failures} of {len(traces)} traces regressed" if failures else "no regressions")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
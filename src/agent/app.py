@@ -4,25 +4,43 @@
 ## Strands Imports
 from strands import Agent, tool 
 from strands.models import BedrockModel
-from strands_tools import retrieve
 from strands.session.file_session_manager import FileSessionManager
 from strands.agent.conversation_manager import SlidingWindowConversationManager
 from mcp import stdio_client, StdioServerParameters
 from strands.tools.mcp import MCPClient
+from tool_execution import ToolClassLimit, ToolConcurrencyLimiter
+from context_compression import ContextCompressor
+from kb_prefetch import KBPrefetcher
+from kb_retrieve import make_retrieve_tool
+from aws_clients import AWSClientFactory
+from chat_events import SESSION_ID_PATTERN, to_chat_event
+from ws_chat import serve_chat_socket
+from profiling import PROFILE_MODES, LoopLagMonitor, ProfileStore, RequestProfiler
+from turn_recording import TurnRecorder, TurnReplayer, load_traces
+from confluence_write_behind import ConfluenceWriteBehind
+from lifecycle import AgentConfig, ConfigGenerations, ServerDraining, TurnDrain
 ## aws imports
 import boto3
 
 ## api imports
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, Header, HTTPException, WebSocket, status
 from fastapi.responses import StreamingResponse 
+from starlette.background import BackgroundTask
+from contextlib import aclosing, asynccontextmanager, nullcontext
 from pydantic import BaseModel, Field
 from typing import Optional, Dict, List,Any
+from collections import OrderedDict
 from uuid import UUID
 import json
+import asyncio
+import re
 
 ## additional imports
 import time,logging
+import hmac
 import signal
+import tempfile
+import threading
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -39,34 +57,98 @@ load_dotenv()
 MODEL_ID = os.getenv("MODEL_ID")
 AWS_REGION = os.getenv("AWS_REGION")
 KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID")
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") # enables the /admin endpoints and the X-Profile header
+TURN_RECORD_DIR = os.getenv("TURN_RECORD_DIR") # record every chat turn into this directory
+TURN_REPLAY_DIR = os.getenv("TURN_REPLAY_DIR") # serve chat turns from the traces in this directory instead of bedrock and confluence
 
 
 ## SETTING UP CONFIGS
 model_temperature = 0.2
+
+# shared boto3 settings for the bedrock model and the knowledge base tools
+aws_max_pool_connections = 50
+aws_connect_timeout = 5
+aws_read_timeout = 120 # seconds allowed between two chunks of a model stream
+aws_max_attempts = 5 # adaptive retry mode
 system_prompt_path = 'src/agent/prompts/system_prompt.md'
-session_id="test_3",
+prompts_dir = 'src/agent/prompts' # a reloaded system_prompt_path must point into this directory
+# optional json file that overrides system_prompt_path, mcp_enabled_tools and model_temperature.
+# read at startup and again on SIGHUP / POST /admin/reload, which swap the new config in without a restart.
+agent_config_path = 'agent_config.json'
+drain_deadline_seconds = 30 # on SIGTERM, running turns get this long to finish before the server stops
 session_storage_dir="sessions/admin" 
+# warm agents kept in memory. the least recently used and idle ones are dropped, their history stays in session_storage_dir
+max_warm_sessions = 200
+session_idle_seconds = 30 * 60
 
 # restricted list of mcp tools to use for demo purposes. some tools such as delete_page has been excluded.
 mcp_enabled_tools='confluence_search,confluence_get_page,confluence_get_page_children,confluence_get_comments,confluence_create_page,confluence_update_page'
+mcp_allowed_tools = set(mcp_enabled_tools.split(',')) # a reload may enable a subset of these, never more
+
+# independent tool calls of one cycle run in parallel. each tool class gets its own concurrency cap and per call timeout (seconds).
+# the single mcp stdio pipe gets a small cap, the knowledge base a larger one.
+tool_class_limits = {
+    'kb': ToolClassLimit(max_concurrency=8, timeout_seconds=30),
+    'mcp': ToolClassLimit(max_concurrency=2, timeout_seconds=60),
+}
+tool_executor_workers = 16 # thread pool used by sync tools such as retrieve
+
+# token budget per tool result. larger kb results and confluence pages are compressed before they reach the model.
+context_token_budgets = {
+    'retrieve': 2000,
+    'confluence_get_page': 3000,
+}
+
+# speculative kb retrieve for the raw user query, started together with the first model call.
+# used when a chat request does not set prefetch_kb itself.
+kb_prefetch_enabled = False
+kb_prefetch_params = {} # extra retrieve parameters for the prefetch, e.g. {'numberOfResults': 5}
+
+# event frames a /ws stream may send before the client grants more credit
+ws_initial_credit = 64
+ws_max_streams = 16 # turns one /ws connection may run at once
+
+# on-demand profiling. a /stream_chat request with "X-Profile: cprofile|sample" (plus X-Admin-Token),
+# or POST /admin/profiling, writes a profile of the request to profile_dir.
+profile_dir = 'profiles'
+profile_dir_max_bytes = 50 * 1024 * 1024 # oldest dumps are deleted above this size
+loop_lag_threshold_ms = None # e.g. 100 logs the loop's stack whenever it is blocked that long. None = off
+
+# record and replay of chat turns (turn_recording.py). recording is on when TURN_RECORD_DIR is set.
+# replay (TURN_REPLAY_DIR, used by benchmarks/replay_turns.py) needs no aws or confluence access.
+turn_replay_time_scale = 1.0 # 1 = recorded timing, 0.1 = ten times faster, 0 = no waiting
+
+# write-behind for confluence_create_page / confluence_update_page. the tool answers at once with a provisional
+# write id and a background worker applies the write (in order per page, with retries, merging queued updates).
+# GET /confluence/writes/{write_id} tells when a write has landed.
+confluence_write_behind_enabled = False
+confluence_write_behind_db = 'confluence_write_queue.sqlite3'
+confluence_write_max_attempts = 5
 
 ## STRANDS AGENT INITIATION
 
-## SET UP LLM 
-bedrock_model = BedrockModel(
-        model_id=MODEL_ID,
-        region_name=AWS_REGION,
-        temperature=model_temperature
-    )
-
-## SET UP SYSTEM PROMPT
-with open(system_prompt_path,'r',encoding='utf-8') as sys_f:
-    system_prompt = sys_f.read()
-
-## SETUP TOOLS
+## SET UP PROFILING
+request_profiler = RequestProfiler(ProfileStore(profile_dir, max_bytes=profile_dir_max_bytes))
+loop_lag_monitor = None
+
+## SET UP RECORD / REPLAY OF TURNS
+turn_recorder = TurnRecorder(TURN_RECORD_DIR) if TURN_RECORD_DIR else None
+turn_replayer = TurnReplayer(load_traces(TURN_REPLAY_DIR), time_scale=turn_replay_time_scale) if TURN_REPLAY_DIR else None
+if turn_replayer:
+    # replayed turns must not read or overwrite real conversations
+    session_storage_dir = tempfile.mkdtemp(prefix="replay-sessions-")
+
+## SET UP SHARED AWS CLIENTS
+aws_clients = AWSClientFactory(
+    max_pool_connections=aws_max_pool_connections,
+    connect_timeout=aws_connect_timeout,
+    read_timeout=aws_read_timeout,
+    max_attempts=aws_max_attempts
+)
 
 ## SETUP KNOWLEDGE BASE RETRIEVE TOOL
-tools = [retrieve]
+# same tool as strands_tools.retrieve, but on the shared bedrock-agent-runtime client
+retrieve_tool = make_retrieve_tool(aws_clients)
 
 
 ## SETUP CONFLUENCE MCP TOOLS 
@@ -81,51 +163,345 @@ CONFLUENCE_TOKEN = os.getenv('CONFLUENCE_TOKEN')
 CONFLUENCE_SPACE_KEY = os.getenv('CONFLUENCE_SPACE_KEY')
 
 
-confluence_mcp_client = MCPClient(lambda: stdio_client(
-    StdioServerParameters(
-        command="uvx",
-        args=[
-            "mcp-atlassian",
-            f"--confluence-url={CONFLUENCE_URL}",
-            f"--confluence-username={CONFLUENCE_USERNAME}",
-            f"--confluence-token={CONFLUENCE_TOKEN}",
-            f"--confluence-spaces-filter={CONFLUENCE_SPACE_KEY}",
-            f"--enabled-tools={mcp_enabled_tools}"
-        ]
-    )
-))
-
-confluence_mcp_client.__enter__()
-confluence_mcp_tools = confluence_mcp_client.list_tools_sync()
-tools = tools + [confluence_mcp_tools]
+def start_confluence_mcp(enabled_tools):
+    """Start the confluence mcp server with the given tools. Returns the client and its tools."""
+    confluence_mcp_client = MCPClient(lambda: stdio_client(
+        StdioServerParameters(
+            command="uvx",
+            args=[
+                "mcp-atlassian",
+                f"--confluence-url={CONFLUENCE_URL}",
+                f"--confluence-username={CONFLUENCE_USERNAME}",
+                f"--confluence-token={CONFLUENCE_TOKEN}",
+                f"--confluence-spaces-filter={CONFLUENCE_SPACE_KEY}",
+                f"--enabled-tools={enabled_tools}"
+            ]
+        )
+    ))
+
+    confluence_mcp_client.__enter__()
+    return confluence_mcp_client, confluence_mcp_client.list_tools_sync()
 
 # confluence mcp integration ends here.
 
-## SET UP SESSION MANAGER FOR PERSISTING CONVERSATION HISTORY
-session_manager = FileSessionManager(
-    session_id=session_id,
-    storage_dir=session_storage_dir
-)
 
-## SET UP CONVERSATION MANAGER FOR MANAGING CONVERSATION ON RUNTIME
-conversation_manager = SlidingWindowConversationManager(
-    window_size=30,  # Maximum number of messages to keep
-    should_truncate_results=True, # Enable truncating the tool result when a message is too large for the model's context window 
+## RELOADABLE AGENT CONFIG (PROMPT, MODEL, TOOLS)
+def load_agent_settings():
+    """Reloadable settings: the defaults above, overridden by agent_config_path."""
+    settings = {
+        'system_prompt_path': system_prompt_path,
+        'mcp_enabled_tools': mcp_enabled_tools,
+        'model_temperature': model_temperature,
+    }
+    if os.path.exists(agent_config_path):
+        with open(agent_config_path, 'r', encoding='utf-8') as config_f:
+            settings.update({k: v for k, v in json.load(config_f).items() if k in settings})
+    return settings
+
+
+def validate_agent_settings(settings):
+    """Reject settings from agent_config_path or a reload that reach outside the prompts dir or the allowed tools."""
+    prompts_root = os.path.realpath(prompts_dir)
+    prompt_file = os.path.realpath(settings['system_prompt_path'])
+    if os.path.commonpath([prompts_root, prompt_file]) != prompts_root:
+        raise ValueError(f"system_prompt_path must be a file in {prompts_dir}")
+
+    tools = settings['mcp_enabled_tools'].split(',') if isinstance(settings['mcp_enabled_tools'], str) else None
+    if not tools or not all(tools) or not set(tools) <= mcp_allowed_tools:
+        # an empty list would start the mcp server with all of its tools
+        raise ValueError(f"mcp_enabled_tools must be a comma separated subset of {','.join(sorted(mcp_allowed_tools))}")
+
+    temperature = settings['model_temperature']
+    if isinstance(temperature, bool) or not isinstance(temperature, (int, float)) or not 0 <= temperature <= 1:
+        raise ValueError("model_temperature must be a number between 0 and 1")
+
+
+def build_agent_config(settings, previous=None):
+    """Build the prompt, model and tools for new turns. Blocking: reads the prompt and may start the mcp server."""
+    validate_agent_settings(settings)
+
+    ## SET UP SYSTEM PROMPT
+    with open(settings['system_prompt_path'],'r',encoding='utf-8') as sys_f:
+        system_prompt = sys_f.read()
+
+    ## SET UP LLM 
+    if turn_replayer:
+        bedrock_model = turn_replayer.model
+    else:
+        bedrock_model = BedrockModel(
+                model_id=MODEL_ID,
+                boto_session=aws_clients.session(region_name=AWS_REGION),
+                boto_client_config=aws_clients.config(),
+                temperature=settings['model_temperature']
+            )
+    if turn_recorder:
+        bedrock_model = turn_recorder.wrap_model(bedrock_model)
+
+    ## SETUP TOOLS
+    version = previous.version + 1 if previous else 1
+    if turn_replayer:
+        # recorded tool specs and results replace the knowledge base and confluence tools
+        return AgentConfig(version, settings, system_prompt, bedrock_model, turn_replayer.tools())
+
+    if previous and previous.settings['mcp_enabled_tools'] == settings['mcp_enabled_tools']:
+        # same tools, keep the running mcp server
+        confluence_mcp_tools = previous.mcp_tools
+        close = previous.hand_over()
+    else:
+        confluence_mcp_client, confluence_mcp_tools = start_confluence_mcp(settings['mcp_enabled_tools'])
+        close = lambda: confluence_mcp_client.__exit__(None, None, None)
+
+    return AgentConfig(version, settings, system_prompt, bedrock_model,
+                       tools=[retrieve_tool, confluence_mcp_tools], mcp_tools=confluence_mcp_tools, close=close)
+
+
+agent_generations = ConfigGenerations(build_agent_config(load_agent_settings()))
+
+## SET UP GRACEFUL DRAIN OF RUNNING TURNS
+turn_drain = TurnDrain()
+
+## SET UP BOUNDED PARALLEL TOOL EXECUTION
+tool_concurrency_limiter = ToolConcurrencyLimiter(
+    limits=tool_class_limits,
+    executor_workers=tool_executor_workers,
+    tool_classes=turn_replayer.tool_classes() if turn_replayer else None
 )
 
-## INITIALIZING STRANDS AGENT
-agent = Agent(
-    model=bedrock_model,
-    system_prompt=system_prompt,
-    session_manager=session_manager,
-    conversation_manager=conversation_manager,
-    callback_handler= None,
-    tools = tools
-            )
+## SET UP WRITE-BEHIND FOR CONFLUENCE PAGE WRITES
+# queued writes are applied under the mcp class limits, shared with the agent's own mcp calls
+confluence_write_behind = None
+if confluence_write_behind_enabled and not turn_replayer:
+    confluence_write_behind = ConfluenceWriteBehind(
+        confluence_write_behind_db,
+        tools=agent_generations.current.mcp_tools,
+        max_attempts=confluence_write_max_attempts,
+        bound=tool_concurrency_limiter.bound
+    )
+
+## SET UP CONTEXT COMPRESSION FOR RETRIEVED CHUNKS
+context_compressor = ContextCompressor(budgets=context_token_budgets)
+
+## SET UP SPECULATIVE KNOWLEDGE BASE RETRIEVAL
+# the prefetch runs under the kb class limits, like the retrieve calls of the model
+kb_prefetcher = KBPrefetcher(params=kb_prefetch_params, bound=tool_concurrency_limiter.bound)
+
+## AGENT HOOKS
+# before-tool callbacks run in this order, after-tool callbacks in reverse. the hooks that swap the
+# selected tool (prefetch, write-behind) come before the concurrency limiter wraps it; the recorder comes last.
+agent_hooks = [kb_prefetcher]
+if confluence_write_behind:
+    agent_hooks.append(confluence_write_behind)
+agent_hooks += [tool_concurrency_limiter, context_compressor]
+if turn_recorder:
+    agent_hooks.append(turn_recorder)
+
+## INITIALIZING STRANDS AGENTS
+# one warm agent per chat session, so concurrent conversations do not share history.
+# model, tools and hooks are shared; each agent has its own session and conversation manager.
+# after a config reload or an eviction a session gets a new agent on its next turn, restored from its session files.
+agents = OrderedDict() # least recently used first
+agent_configs = {} # config generation each session's agent was built from
+session_managers = {}
+agent_last_used = {}
+agent_locks = {} # a session runs one turn at a time
+session_users = {} # turns running or waiting per session. sessions in use are never evicted
+
+def get_agent(session_id, config=None):
+    if not re.match(SESSION_ID_PATTERN, session_id):
+        raise ValueError(f"invalid session id {session_id!r}") # it becomes a directory name under session_storage_dir
+    config = config or agent_generations.current
+    if agent_configs.get(session_id) is not config:
+        ## SET UP SESSION MANAGER FOR PERSISTING CONVERSATION HISTORY
+        session_manager = FileSessionManager(
+            session_id=session_id,
+            storage_dir=session_storage_dir
+        )
+
+        ## SET UP CONVERSATION MANAGER FOR MANAGING CONVERSATION ON RUNTIME
+        conversation_manager = SlidingWindowConversationManager(
+            window_size=30,  # Maximum number of messages to keep
+            should_truncate_results=True, # Enable truncating the tool result when a message is too large for the model's context window 
+        )
+
+        agents[session_id] = Agent(
+            model=config.model,
+            system_prompt=config.system_prompt,
+            session_manager=session_manager,
+            conversation_manager=conversation_manager,
+            callback_handler= None,
+            tools = config.tools,
+            hooks = agent_hooks
+                    )
+        agent_configs[session_id] = config
+        session_managers[session_id] = session_manager
+    agents.move_to_end(session_id)
+    agent_last_used[session_id] = time.monotonic()
+    evict_idle_sessions(keep=session_id)
+    return agents[session_id]
+
+
+def evict_idle_sessions(keep=None):
+    """Drop warm agents above max_warm_sessions or idle for session_idle_seconds, least recently used first."""
+    now = time.monotonic()
+    for idle_session_id in list(agents):
+        if len(agents) <= max_warm_sessions and now - agent_last_used[idle_session_id] < session_idle_seconds:
+            break
+        if idle_session_id == keep or idle_session_id in session_users:
+            continue
+        try:
+            session_managers[idle_session_id].sync_agent(agents[idle_session_id])
+        except Exception:
+            logger.exception(f"could not flush session {idle_session_id}")
+        for per_session in (agents, agent_configs, session_managers, agent_last_used, agent_locks):
+            per_session.pop(idle_session_id, None)
+
+
+@asynccontextmanager
+async def session_lock(session_id):
+    """Run one turn at a time per session. Holding or waiting for the lock keeps the session from being evicted."""
+    session_users[session_id] = session_users.get(session_id, 0) + 1
+    if session_id not in agent_locks:
+        agent_locks[session_id] = asyncio.Lock()
+    try:
+        async with agent_locks[session_id]:
+            yield
+    finally:
+        session_users[session_id] -= 1
+        if not session_users[session_id]:
+            del session_users[session_id]
+
+
+async def agent_turn(session_id, message, prefetch_kb=None, reservation=None):
+    """Run one chat turn on the session's agent and yield its message and tool events.
+
+    `reservation` (from turn_drain.reserve) admits a turn that was accepted before a drain started.
+    """
+    if prefetch_kb is None:
+        prefetch_kb = kb_prefetch_enabled
+
+    # a turn waiting for its session counts as running, so a drain waits for it too
+    with turn_drain.turn(reservation):
+        async with session_lock(session_id):
+            # the turn keeps the config it started with, a reload meanwhile only affects later turns
+            with agent_generations.pin() as config:
+                session_agent = get_agent(session_id, config)
+                with turn_trace(session_id, message, prefetch_kb) as trace:
+                    kb_prefetch = kb_prefetcher.start(session_agent, message) if prefetch_kb else None
+                    try:
+                        async with aclosing(session_agent.stream_async(message, kb_prefetch=kb_prefetch)) as events:
+                            async for event in events:
+                                chat_event = to_chat_event(event)
+                                if chat_event is not None:
+                                    if trace is not None:
+                                        trace.add_output(chat_event)
+                                    yield chat_event
+                    finally:
+                        kb_prefetcher.finish(kb_prefetch)
+
+def turn_trace(session_id, message, prefetch_kb):
+    """Record or replay context of one turn. Entered before the prefetch task starts so the task inherits it."""
+    if turn_recorder:
+        return turn_recorder.turn(session_id, message, prefetch_kb)
+    if turn_replayer:
+        return turn_replayer.turn(message)
+    return nullcontext()
+
+
+async def reload_agent_config(settings):
+    """Swap in a new prompt / tools / model config for new turns. Running turns finish on the old one."""
+    config = await agent_generations.swap(lambda previous: build_agent_config(settings, previous))
+    if confluence_write_behind:
+        confluence_write_behind.use_tools(config.mcp_tools)
+    return config
+
+
+def flush_sessions():
+    """Write the state of every warm agent to its session files."""
+    for session_id, session_manager in session_managers.items():
+        try:
+            session_manager.sync_agent(agents[session_id])
+        except Exception:
+            logger.exception(f"could not flush session {session_id}")
+
+
+## SIGNALS: SIGHUP RELOADS THE AGENT CONFIG, SIGTERM DRAINS RUNNING TURNS BEFORE UVICORN SHUTS DOWN
+signal_tasks = set() # reloads and drains started by a signal
+def install_signal_handlers(loop):
+    if threading.current_thread() is not threading.main_thread():
+        return # signal handlers can only be set from the main thread (not the case under a test client)
+    uvicorn_sigterm = signal.getsignal(signal.SIGTERM)
+
+    def run_soon(coro):
+        # the loop only keeps weak references to tasks, so they are held here until done
+        def start():
+            task = loop.create_task(coro)
+            signal_tasks.add(task)
+            task.add_done_callback(signal_tasks.discard)
+        loop.call_soon_threadsafe(start)
+
+    async def reload_on_signal():
+        try:
+            config = await reload_agent_config(load_agent_settings())
+            logger.info(f"SIGHUP: agent config {config.version} loaded")
+        except Exception:
+            logger.exception(f"SIGHUP: reload failed, staying on agent config {agent_generations.current.version}")
+
+    async def drain_then_exit(signum, frame):
+        result = await turn_drain.drain(drain_deadline_seconds)
+        logger.info(f"SIGTERM: drained running turns {result}")
+        if callable(uvicorn_sigterm):
+            uvicorn_sigterm(signum, frame) # uvicorn closes the connections and runs the lifespan shutdown
+        else:
+            signal.signal(signal.SIGTERM, uvicorn_sigterm)
+            signal.raise_signal(signal.SIGTERM)
+
+    def on_sighup(signum, frame):
+        run_soon(reload_on_signal())
+
+    def on_sigterm(signum, frame):
+        if turn_drain.draining and callable(uvicorn_sigterm):
+            uvicorn_sigterm(signum, frame) # second SIGTERM, stop waiting
+            return
+        run_soon(drain_then_exit(signum, frame))
+
+    signal.signal(signal.SIGHUP, on_sighup)
+    signal.signal(signal.SIGTERM, on_sigterm)
 
 
 ### FASTAPI PART
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    loop = asyncio.get_running_loop()
+    # sync tools run through asyncio.to_thread, so the tool thread pool becomes the loop's default executor
+    tool_concurrency_limiter.install(loop)
+    if loop_lag_threshold_ms:
+        start_loop_lag_monitor(loop_lag_threshold_ms)
+    if confluence_write_behind:
+        confluence_write_behind.start()
+    install_signal_handlers(loop)
+    yield
+    # turns still running here (e.g. after SIGINT) get the same deadline
+    await turn_drain.drain(drain_deadline_seconds)
+    if confluence_write_behind:
+        await confluence_write_behind.stop()
+    if loop_lag_monitor:
+        loop_lag_monitor.stop()
+    flush_sessions()
+    if turn_recorder:
+        turn_recorder.close() # waits for traces still being written
+    agent_generations.close_all() # stops the mcp server(s)
+
+
+def start_loop_lag_monitor(threshold_ms):
+    global loop_lag_monitor
+    if loop_lag_monitor:
+        loop_lag_monitor.stop()
+    loop_lag_monitor = LoopLagMonitor(threshold_seconds=threshold_ms / 1000)
+    loop_lag_monitor.start(asyncio.get_running_loop())
+
+
 app = FastAPI(
+    lifespan=lifespan,
     title="DEMO AGENT API",
     description="DEMO AGENT API WITH ACCESS TO BEDROCK KNOWLEDGE BASE AND CONFLUENCE MCP USING CLAUDE SONNET 4",
     version="1.0.0",
@@ -137,57 +513,149 @@ app = FastAPI(
 class ChatRequest(BaseModel):
     """Request model for chat endpoint."""
     query: str = Field(..., description="User's question/message", min_length=1)
-    session_id: str = Field(default="test", description="Session identifier")
+    session_id: str = Field(default="test", description="Session identifier: letters, digits, _ and -, at most 64", pattern=SESSION_ID_PATTERN)
+    prefetch_kb: Optional[bool] = Field(default=None, description="Start the KB retrieve for the raw query in parallel with the first model call. Defaults to the server setting.")
 
 
+class ProfilingRequest(BaseModel):
+    """Request model for the profiling admin endpoint."""
+    mode: Optional[str] = Field(default=None, description="cprofile or sample profiles the next chat requests, null disarms")
+    requests: int = Field(default=1, ge=1, description="Number of /stream_chat requests to profile")
+    loop_lag_threshold_ms: Optional[float] = Field(default=None, gt=0, description="Start (or retune) the event loop lag monitor")
+    stop_loop_lag_monitor: bool = Field(default=False, description="Stop the event loop lag monitor")
 
-## OUTPUT RESPONSE SERIALIZATION FOR STREAMING CHAT ENDPOINT
-class SSEMessageData(BaseModel):
-    event_loop_cycle_id: str
-    message: str
-    
 
-class SSEToolData(BaseModel):
-    event_loop_cycle_id: str
-    tool_name: str
-    toolUseId: str
-    tool_input: Dict = Field(default_factory=lambda: {'state': 'in-progress'})
+def is_admin(x_admin_token: Optional[str]) -> bool:
+    # constant time comparison, so response timing does not reveal how much of a guess was right
+    return bool(ADMIN_TOKEN) and x_admin_token is not None and hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode())
 
-    
 
-class SSEMessageEvent(BaseModel):
-    event: str
-    data: SSEMessageData
-    
-    def serialize(self):
-        return f"event: {self.event}\ndata: {json.dumps(self.data.dict())}\n\n"
+class ReloadRequest(BaseModel):
+    """Request model for the config reload admin endpoint. Unset fields keep their current value."""
+    system_prompt_path: Optional[str] = Field(default=None, description="Prompt file in src/agent/prompts, read again on every reload")
+    mcp_enabled_tools: Optional[str] = Field(default=None, description="Comma separated subset of the allowed confluence tools. A change starts a new mcp server")
+    model_temperature: Optional[float] = Field(default=None, ge=0, le=1)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin token missing or invalid")
 
-class SSEToolEvent(BaseModel):
-    event: str
-    data: SSEToolData
-    
-    def serialize(self):
-        return f"event: {self.event}\ndata: {json.dumps(self.data.dict())}\n\n"
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
+    if turn_drain.draining:
+        # load balancers stop sending new chats here while running turns finish
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Draining")
     return {
         "status": "healthy",
-        "agent_initialized": agent is not None,
+        "agent_initialized": agent_generations.current is not None,
+        "agent_config_version": agent_generations.current.version,
+        "warm_sessions": len(agents),
         "message": "Strands Agent is running."
     }
 
 
+@app.get("/stats")
+async def stats():
+    """Runtime statistics of the agent's performance features."""
+    return {
+        "context_compression": context_compressor.stats(),
+        "kb_prefetch": kb_prefetcher.stats(),
+        # the write queue is sqlite behind a lock the worker also takes, so it is read off the event loop
+        "confluence_write_behind": await asyncio.to_thread(confluence_write_behind.stats) if confluence_write_behind else None
+    }
+
+
+@app.get("/confluence/writes", dependencies=[Depends(require_admin)])
+async def confluence_writes(limit: int = 50, state: Optional[str] = None):
+    """Most recent queued Confluence writes, optionally only those in one state (queued, applying, landed, failed, coalesced)."""
+    if not confluence_write_behind:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Confluence write-behind is disabled")
+    return await asyncio.to_thread(confluence_write_behind.queue.recent, limit=limit, state=state)
+
+
+@app.get("/confluence/writes/{write_id}", dependencies=[Depends(require_admin)])
+async def confluence_write_status(write_id: str):
+    """State of one queued Confluence write. landed_at and page_id are set once it reached Confluence."""
+    if not confluence_write_behind:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Confluence write-behind is disabled")
+    write = await asyncio.to_thread(confluence_write_behind.queue.status, write_id)
+    if write is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Unknown write {write_id}")
+    return write
+
+
+@app.get("/admin/profiling", dependencies=[Depends(require_admin)])
+async def profiling_status():
+    """Armed profiles, event loop lag monitor and the profile dumps on disk."""
+    return {
+        "armed_mode": request_profiler.armed_mode,
+        "armed_requests": request_profiler.armed_requests,
+        "loop_lag": loop_lag_monitor.stats() if loop_lag_monitor else None,
+        "profile_dir": profile_dir,
+        "profiles": request_profiler.store.list()
+    }
+
+
+@app.post("/admin/profiling", dependencies=[Depends(require_admin)])
+async def configure_profiling(request: ProfilingRequest):
+    """Profile the next chat requests and/or start/stop the event loop lag monitor."""
+    global loop_lag_monitor
+    if request.mode is not None and request.mode not in PROFILE_MODES:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"mode must be one of {PROFILE_MODES}")
+    request_profiler.arm(request.mode, request.requests)
+    if request.loop_lag_threshold_ms:
+        start_loop_lag_monitor(request.loop_lag_threshold_ms)
+    elif request.stop_loop_lag_monitor and loop_lag_monitor:
+        loop_lag_monitor.stop()
+        loop_lag_monitor = None
+    return await profiling_status()
+
+
+@app.get("/admin/config", dependencies=[Depends(require_admin)])
+async def agent_config_status():
+    """Agent config used by new turns, retired configs that still have turns running, and drain state."""
+    return {
+        "current": agent_generations.current.info(),
+        "retired": [config.info() for config in agent_generations.retired],
+        "draining": turn_drain.draining,
+        "turns_in_flight": turn_drain.in_flight
+    }
+
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_config(request: ReloadRequest):
+    """Swap in a new prompt / tool / model config for new turns, like SIGHUP. Running turns finish on the old one."""
+    try:
+        changes = {k: v for k, v in request.dict().items() if v is not None}
+        await reload_agent_config({**agent_generations.current.settings, **changes})
+    except Exception as e:
+        logger.exception("agent config reload failed")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Reload failed, still on agent config {agent_generations.current.version}: {e}"
+        )
+    return await agent_config_status()
+
+
 
 
 
 @app.post("/stream_chat") 
 
-async def chat_endpoint(request: ChatRequest): 
+async def chat_endpoint(request: ChatRequest, x_profile: Optional[str] = Header(default=None),
+                        x_admin_token: Optional[str] = Header(default=None)): 
     message = request.query
     session_id = request.session_id
+    try:
+        # admitted here, before the response headers go out. a drain that starts later waits for this turn
+        reservation = turn_drain.reserve()
+    except ServerDraining:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is shutting down")
+    profile_mode = request_profiler.mode_for(x_profile if is_admin(x_admin_token) else None)
     """
     Chat with the context-managed agent.
     
@@ -199,53 +667,32 @@ async def chat_endpoint(request: ChatRequest):
     this is a streaming endpoint
     """
     async def stream_response(): 
-
-        if not agent:
-            raise HTTPException(
-                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                detail="Agent not initialized"
-            )
-        
-       
         logger.info(f"Processing chat request for session: {session_id}")
         logger.info(f"Using agent for processing")
 
-        async for event in agent.stream_async(message): 
-            
-            if "data" in event: 
-                sse_event = SSEMessageEvent(
-                    event="message", 
-                    data = SSEMessageData(
-                    event_loop_cycle_id = str(event['event_loop_cycle_id']),
-                    message=event['data']
-                ))
-                yield sse_event.serialize()
-                
-            elif "current_tool_use" in event: 
-                tool_input_str = event['current_tool_use']['input']
-                logger.info(f"tool_input_str = {tool_input_str}")
-                
-                try:
-                    # Use json.loads() to parse JSON string to dictionary
-                    tool_input_dict = json.loads(tool_input_str)
-                    tool_input_dict['state'] = 'done'
-                except Exception as e:
-                    # logger.error(f"Could not convert string || {tool_input_str} || to json.\n Error: {e}")
-                    tool_input_dict = {'state': 'in-progress'}
-
-                sse_event = SSEToolEvent    (
-                    event = "tool",
-                    data = SSEToolData(
-                    event_loop_cycle_id= str(event['event_loop_cycle_id']),
-                    tool_name = event['current_tool_use']['name'],
-                    toolUseId = event['current_tool_use']['toolUseId'],
-                    tool_input = tool_input_dict
-                    
-                                        )     
-                                            )
-                yield sse_event.serialize()
-
-    return StreamingResponse(stream_response(), media_type="text/event-stream") 
+        # a client that disconnects cancels this generator; aclosing ends the turn with it
+        async with aclosing(agent_turn(session_id, message, request.prefetch_kb, reservation)) as chat_events:
+            async for chat_event in chat_events:
+                yield chat_event.serialize()
+
+    response = stream_response()
+    if profile_mode:
+        # serialization is part of the hot path, so the whole SSE stream is profiled
+        response = request_profiler.profile(response, profile_mode, f"stream_chat_{session_id}")
+    # the background task drops the reservation if the stream never started (client gone before the body)
+    return StreamingResponse(response, media_type="text/event-stream", background=BackgroundTask(reservation.release)) 
+
+
+@app.websocket("/ws")
+async def ws_endpoint(websocket: WebSocket):
+    """
+    Multiplexed chat over one WebSocket.
+
+    Many conversations run concurrently on one connection. Frames are tagged with
+    session_id and request_id and carry the same message/tool events as /stream_chat.
+    See ws_chat.py for the frame format, flow control and cancellation.
+    """
+    await serve_chat_socket(websocket, agent_turn, initial_credit=ws_initial_credit, max_streams=ws_max_streams)
 
 
 
@@ -256,6 +703,7 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=8000,
         reload=True,
-        log_level="info"
+        log_level="info",
+        timeout_graceful_shutdown=drain_deadline_seconds + 5 # turns are drained first, see install_signal_handlers
     ) 
 
@@ -0,0 +1,69 @@
+## Shared AWS client factory
+# boto3 defaults give every client a 10 connection pool, legacy retries and a fresh client (and
+# TLS handshake) wherever one is created. The model and the retrieval tools get their sessions,
+# botocore config and clients from here instead, so connections are pooled and reused across
+# chat sessions and threads.
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import boto3
+from botocore.config import Config as BotocoreConfig
+
+
+class AWSClientFactory:
+    """Creates tuned boto3 clients once and hands the same client to every caller.
+
+    boto3 clients are thread safe, sessions are not, so clients are built under a lock and
+    cached per (service, region, profile, endpoint).
+    """
+
+    def __init__(
+        self,
+        max_pool_connections: int = 50,
+        connect_timeout: float = 5,
+        read_timeout: float = 120,  # time allowed between two chunks of a model stream
+        max_attempts: int = 5,
+        retry_mode: str = "adaptive",
+        tcp_keepalive: bool = True,
+    ):
+        self.max_pool_connections = max_pool_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_attempts = max_attempts
+        self.retry_mode = retry_mode
+        self.tcp_keepalive = tcp_keepalive
+        self._sessions: Dict[Tuple, boto3.Session] = {}
+        self._clients: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def config(self, **overrides: Any) -> BotocoreConfig:
+        settings = {
+            "max_pool_connections": self.max_pool_connections,
+            "connect_timeout": self.connect_timeout,
+            "read_timeout": self.read_timeout,
+            "retries": {"max_attempts": self.max_attempts, "mode": self.retry_mode},
+            "tcp_keepalive": self.tcp_keepalive,
+            **overrides,
+        }
+        return BotocoreConfig(**settings)
+
+    def session(self, region_name: Optional[str] = None, profile_name: Optional[str] = None) -> boto3.Session:
+        key = (region_name, profile_name)
+        with self._lock:
+            if key not in self._sessions:
+                self._sessions[key] = boto3.Session(region_name=region_name, profile_name=profile_name)
+            return self._sessions[key]
+
+    def client(self, service_name: str, region_name: Optional[str] = None, profile_name: Optional[str] = None,
+               endpoint_url: Optional[str] = None):
+        key = (service_name, region_name, profile_name, endpoint_url)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+
+        session = self.session(region_name, profile_name)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = session.client(service_name, config=self.config(), endpoint_url=endpoint_url)
+            return self._clients[key]
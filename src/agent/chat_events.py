@@ -0,0 +1,92 @@
+## Chat event schema shared by the SSE (/stream_chat) and WebSocket (/ws) endpoints
+
+import json
+import logging
+from typing import Dict, Optional, Union
+
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+# session ids name a directory under the session storage dir, so they are restricted to a safe set of characters
+SESSION_ID_PATTERN = r'^[A-Za-z0-9_-]{1,64}$'
+
+
+## OUTPUT RESPONSE SERIALIZATION FOR STREAMING CHAT ENDPOINT
+class SSEMessageData(BaseModel):
+    event_loop_cycle_id: str
+    message: str
+
+
+class SSEToolData(BaseModel):
+    event_loop_cycle_id: str
+    tool_name: str
+    toolUseId: str
+    tool_input: Dict = Field(default_factory=lambda: {'state': 'in-progress'})
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+
+
+class SSEMessageEvent(BaseModel):
+    event: str
+    data: SSEMessageData
+
+    def serialize(self):
+        return f"event: {self.event}\ndata: {json.dumps(self.data.dict())}\n\n"
+
+class SSEToolEvent(BaseModel):
+    event: str
+    data: SSEToolData
+
+    def serialize(self):
+        return f"event: {self.event}\ndata: {json.dumps(self.data.dict())}\n\n"
+
+
+def to_chat_event(event: Dict) -> Optional[Union[SSEMessageEvent, SSEToolEvent]]:
+    """Convert one Agent.stream_async event to a message or tool event, if the client should see it."""
+    if "data" in event:
+        return SSEMessageEvent(
+            event="message",
+            data = SSEMessageData(
+            event_loop_cycle_id = str(event['event_loop_cycle_id']),
+            message=event['data']
+        ))
+
+    elif "current_tool_use" in event:
+        tool_input_str = event['current_tool_use']['input']
+        logger.info(f"tool_input_str = {tool_input_str}")
+
+        try:
+            # Use json.loads() to parse JSON string to dictionary
+            tool_input_dict = json.loads(tool_input_str)
+            # input is complete, the call itself has not started yet
+            tool_input_dict['state'] = 'queued'
+        except Exception as e:
+            # logger.error(f"Could not convert string || {tool_input_str} || to json.\n Error: {e}")
+            tool_input_dict = {'state': 'in-progress'}
+
+        return SSEToolEvent(
+            event = "tool",
+            data = SSEToolData(
+            event_loop_cycle_id= str(event['event_loop_cycle_id']),
+            tool_name = event['current_tool_use']['name'],
+            toolUseId = event['current_tool_use']['toolUseId'],
+            tool_input = tool_input_dict
+            ))
+
+    elif "tool_status" in event:
+        # real start and finish of a tool call, reported by the tool concurrency limiter
+        tool_status = event['tool_status']
+        return SSEToolEvent(
+            event = "tool",
+            data = SSEToolData(
+            event_loop_cycle_id = str(tool_status['event_loop_cycle_id']),
+            tool_name = tool_status['tool_name'],
+            toolUseId = tool_status['toolUseId'],
+            tool_input = {**tool_status['tool_input'], 'state': tool_status['state']},
+            started_at = tool_status['started_at'],
+            finished_at = tool_status['finished_at']
+            ))
+
+    return None
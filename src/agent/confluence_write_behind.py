@@ -0,0 +1,335 @@
+## Write-behind for Confluence page writes
+# confluence_create_page and confluence_update_page normally block the turn on a slow write
+# through the single MCP pipe. With write-behind on, the call is stored in a local SQLite queue
+# and the tool answers at once with a provisional write id. A background worker applies the
+# queued writes through the real MCP tools:
+#   - in order per page (an update of a page that is still being created waits for the create,
+#     and may use the create's write id as page_id),
+#   - with retries and exponential backoff,
+#   - merging successive updates of the same page that are still queued into one write.
+# The queue survives restarts. A write interrupted by a restart is applied again (at least once).
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from strands.experimental.hooks import BeforeToolInvocationEvent
+from strands.hooks import HookProvider, HookRegistry
+from strands.types.tools import AgentTool, ToolGenerator, ToolUse
+
+logger = logging.getLogger(__name__)
+
+CREATE_TOOL = "confluence_create_page"
+UPDATE_TOOL = "confluence_update_page"
+WRITE_TOOLS = {CREATE_TOOL, UPDATE_TOOL}
+
+# page id handed out for a page that is still being created
+PENDING_PREFIX = "pending-"
+
+# states: queued -> applying -> landed | failed. a coalesced write follows the write it was merged into.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS writes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    write_id TEXT UNIQUE NOT NULL,
+    tool_name TEXT NOT NULL,
+    page_key TEXT NOT NULL,
+    input TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    coalesced_into TEXT,
+    page_id TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    landed_at REAL
+);
+CREATE INDEX IF NOT EXISTS writes_pending ON writes (state, page_key, id);
+"""
+
+# a queued write with no earlier unfinished write of the same page
+FIRST_IN_LINE = """w.state = 'queued' AND NOT EXISTS (
+    SELECT 1 FROM writes e WHERE e.page_key = w.page_key AND e.id < w.id AND e.state IN ('queued', 'applying'))"""
+
+
+def page_id_from_result(result: Dict[str, Any]) -> Optional[str]:
+    """Page id in a create/update result of mcp-atlassian ({"page": {"id": ...}} as json text)."""
+    for content in result.get("content") or []:
+        value = content.get("json")
+        if value is None and "text" in content:
+            try:
+                value = json.loads(content["text"])
+            except ValueError:
+                continue
+        if isinstance(value, dict):
+            page = value.get("page") if isinstance(value.get("page"), dict) else value
+            if page.get("id"):
+                return str(page["id"])
+    return None
+
+
+class WriteQueue:
+    """Durable queue of page writes in SQLite. Safe to call from several threads."""
+
+    def __init__(self, path: str, max_attempts: int = 5, backoff_seconds: float = 2.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        # writes cut off by a restart are applied again
+        self._db.execute("UPDATE writes SET state = 'queued' WHERE state = 'applying'")
+
+    def _row(self, write_id: str) -> Optional[sqlite3.Row]:
+        return self._db.execute("SELECT * FROM writes WHERE write_id = ?", (write_id,)).fetchone()
+
+    def enqueue(self, tool_name: str, tool_input: Dict[str, Any]) -> Dict[str, Any]:
+        write_id = f"{PENDING_PREFIX}{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if tool_name == CREATE_TOOL:
+                    page_key = write_id
+                else:
+                    page_id = str(tool_input.get("page_id", ""))
+                    create = self._row(page_id) if page_id.startswith(PENDING_PREFIX) else None
+                    # an update of a page that is still being created is ordered after the create
+                    page_key = create["page_key"] if create else page_id
+
+                # merge into the page's last write if it is an update that has not started yet
+                last = self._db.execute(
+                    "SELECT * FROM writes WHERE page_key = ? AND state != 'coalesced' ORDER BY id DESC LIMIT 1", (page_key,)
+                ).fetchone()
+                coalesced_into = None
+                if tool_name == UPDATE_TOOL and last is not None and last["tool_name"] == UPDATE_TOOL and last["state"] == "queued":
+                    merged = {**json.loads(last["input"]), **tool_input}
+                    self._db.execute("UPDATE writes SET input = ? WHERE id = ?", (json.dumps(merged), last["id"]))
+                    coalesced_into = last["write_id"]
+
+                self._db.execute(
+                    "INSERT INTO writes (write_id, tool_name, page_key, input, state, coalesced_into, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (write_id, tool_name, page_key, json.dumps(tool_input), "coalesced" if coalesced_into else "queued",
+                     coalesced_into, time.time()),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return {"write_id": write_id, "coalesced_into": coalesced_into}
+
+    def claim_next(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest write that is due and first in line for its page as applying."""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT * FROM writes w WHERE {FIRST_IN_LINE} AND next_attempt_at <= ? ORDER BY id LIMIT 1", (time.time(),)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE writes SET state = 'applying', attempts = attempts + 1 WHERE id = ?", (row["id"],))
+            write = dict(row)
+            write["input"] = json.loads(write["input"])
+            write["attempts"] += 1
+            return write
+
+    def resolve_page_id(self, write_id: str) -> Dict[str, Any]:
+        """State and page id of the create behind a pending page id."""
+        with self._lock:
+            row = self._row(write_id)
+        return {"state": row["state"], "page_id": row["page_id"]} if row else {"state": "unknown", "page_id": None}
+
+    def landed(self, write: Dict[str, Any], page_id: Optional[str]) -> None:
+        with self._lock:
+            self._db.execute("UPDATE writes SET state = 'landed', page_id = ?, error = NULL, landed_at = ? WHERE id = ?",
+                             (page_id, time.time(), write["id"]))
+            if write["tool_name"] == CREATE_TOOL and page_id:
+                # later writes of the new page line up under its real id
+                self._db.execute("UPDATE writes SET page_key = ? WHERE page_key = ?", (page_id, write["page_key"]))
+
+    def failed(self, write: Dict[str, Any], error: str, retry: bool = True) -> None:
+        with self._lock:
+            if retry and write["attempts"] < self.max_attempts:
+                delay = self.backoff_seconds * 2 ** (write["attempts"] - 1)
+                self._db.execute("UPDATE writes SET state = 'queued', error = ?, next_attempt_at = ? WHERE id = ?",
+                                 (error, time.time() + delay, write["id"]))
+            else:
+                self._db.execute("UPDATE writes SET state = 'failed', error = ? WHERE id = ?", (error, write["id"]))
+
+    def next_due_in(self) -> Optional[float]:
+        with self._lock:
+            row = self._db.execute(f"SELECT MIN(next_attempt_at) FROM writes w WHERE {FIRST_IN_LINE}").fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def status(self, write_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._row(write_id)
+            if row is None:
+                return None
+            status = dict(row)
+            if row["coalesced_into"]:
+                # a merged write lands together with the write that carries it
+                target = self._row(row["coalesced_into"])
+                status.update(state=target["state"], page_id=target["page_id"], error=target["error"],
+                              landed_at=target["landed_at"], attempts=target["attempts"])
+        status["input"] = json.loads(status["input"])
+        status.pop("id")
+        return status
+
+    def recent(self, limit: int = 50, state: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT write_id FROM writes WHERE (? IS NULL OR state = ?) ORDER BY id DESC LIMIT ?", (state, state, limit)
+            ).fetchall()
+        return [self.status(row["write_id"]) for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT state, COUNT(*) FROM writes GROUP BY state").fetchall()
+        return {row[0]: row[1] for row in rows}
+
+
+class WriteBehindTool(AgentTool):
+    """Queues a page write and answers with its provisional write id instead of calling Confluence."""
+
+    def __init__(self, tool: AgentTool, queue: WriteQueue, notify):
+        super().__init__()
+        self._tool = tool
+        self._queue = queue
+        self._notify = notify
+
+    @property
+    def tool_name(self) -> str:
+        return self._tool.tool_name
+
+    @property
+    def tool_spec(self):
+        return self._tool.tool_spec
+
+    @property
+    def tool_type(self) -> str:
+        return self._tool.tool_type
+
+    async def stream(self, tool_use: ToolUse, invocation_state: Dict[str, Any], **kwargs: Any) -> ToolGenerator:
+        queued = await asyncio.to_thread(self._queue.enqueue, self.tool_name, tool_use.get("input") or {})
+        self._notify()
+        note = ("The page will be created in the background. Until then use write_id as its page_id."
+                if self.tool_name == CREATE_TOOL else "The update will be applied in the background.")
+        yield {
+            "toolUseId": tool_use["toolUseId"],
+            "status": "success",
+            "content": [{"json": {"status": "queued", "write_id": queued["write_id"], "message": note}}],
+        }
+
+
+class ConfluenceWriteBehind(HookProvider):
+    """Hook that queues Confluence page writes, plus the worker that applies them.
+
+    `tools` are the real MCP tools; the worker calls them by name, also for writes queued
+    before a restart. `bound` wraps a tool in its class limits (ToolConcurrencyLimiter.bound),
+    so queued writes share the mcp concurrency cap and timeout with the agent's own calls.
+    `write_timeout_seconds` also bounds the wait for a free slot.
+    """
+
+    def __init__(self, path: str, tools: List[AgentTool], max_attempts: int = 5, backoff_seconds: float = 2.0,
+                 write_timeout_seconds: float = 120.0, bound: Optional[Callable[[AgentTool], AgentTool]] = None):
+        self.queue = WriteQueue(path, max_attempts=max_attempts, backoff_seconds=backoff_seconds)
+        self.bound = bound
+        self.tools: Dict[str, AgentTool] = {}
+        self.use_tools(tools)
+        self.write_timeout_seconds = write_timeout_seconds
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(BeforeToolInvocationEvent, self.queue_write)
+
+    def use_tools(self, tools: List[AgentTool]) -> None:
+        """Apply writes with these MCP tools from now on (after a config reload)."""
+        self.tools = {tool.tool_name: tool for tool in tools if tool.tool_name in WRITE_TOOLS}
+
+    def queue_write(self, event: BeforeToolInvocationEvent) -> None:
+        if event.selected_tool is not None and event.tool_use["name"] in self.tools:
+            event.selected_tool = WriteBehindTool(event.selected_tool, self.queue, self.notify)
+
+    def notify(self) -> None:
+        if self._wake is not None:
+            self._wake.set()
+
+    def start(self) -> None:
+        """Start the worker on the running event loop."""
+        self._wake = asyncio.Event()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self) -> None:
+        while True:
+            write = await asyncio.to_thread(self.queue.claim_next)
+            if write is None:
+                self._wake.clear()
+                due_in = await asyncio.to_thread(self.queue.next_due_in)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=due_in)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._apply(write)
+
+    async def _apply(self, write: Dict[str, Any]) -> None:
+        tool_input = dict(write["input"])
+        page_id = str(tool_input.get("page_id", ""))
+        if write["tool_name"] == UPDATE_TOOL and page_id.startswith(PENDING_PREFIX):
+            create = await asyncio.to_thread(self.queue.resolve_page_id, page_id)
+            if not create["page_id"]:
+                await asyncio.to_thread(self.queue.failed, write, f"page {page_id} was not created ({create['state']})", False)
+                return
+            tool_input["page_id"] = create["page_id"]
+
+        tool = self.tools.get(write["tool_name"])
+        if tool is None:
+            await asyncio.to_thread(self.queue.failed, write, f"tool {write['tool_name']} is not available")
+            return
+        if self.bound:
+            tool = self.bound(tool)
+
+        tool_use: ToolUse = {"toolUseId": f"write_behind_{write['id']}", "name": write["tool_name"], "input": tool_input}
+
+        async def call():
+            # the last event is the result. a timeout of the bound tool comes back as an error result and is retried
+            result = None
+            async for event in tool.stream(tool_use, {}):
+                result = event
+            return result
+
+        try:
+            result = await asyncio.wait_for(call(), timeout=self.write_timeout_seconds)
+        except Exception as e:
+            logger.warning(f"confluence write {write['write_id']} attempt {write['attempts']} failed: {e!r}")
+            await asyncio.to_thread(self.queue.failed, write, repr(e))
+            return
+
+        if result is None or result.get("status") != "success":
+            error = json.dumps(result.get("content") if result else None)[:1000]
+            logger.warning(f"confluence write {write['write_id']} attempt {write['attempts']} failed: {error}")
+            await asyncio.to_thread(self.queue.failed, write, error)
+            return
+
+        landed_page_id = page_id_from_result(result) or tool_input.get("page_id")
+        await asyncio.to_thread(self.queue.landed, write, landed_page_id)
+        logger.info(f"confluence write {write['write_id']} ({write['tool_name']}) landed on page {landed_page_id}")
+
+    def stats(self) -> Dict[str, int]:
+        return self.queue.counts()
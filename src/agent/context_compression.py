@@ -0,0 +1,250 @@
+## Token-budgeted compression of retrieved context
+# KB `retrieve` results and confluence page bodies are compressed right after the tool
+# returns, before the result is appended to the conversation: boilerplate is stripped,
+# overlapping chunks are deduplicated, passages are ranked against the query and only as
+# many as fit in the tool's token budget are kept. Source ids and urls are never dropped.
+
+import json
+import logging
+import math
+import re
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from strands.experimental.hooks import AfterToolInvocationEvent
+from strands.hooks import HookProvider, HookRegistry
+
+logger = logging.getLogger(__name__)
+
+# rough token estimate, close enough for budgeting claude/nova prompts without a tokenizer
+CHARS_PER_TOKEN = 4
+
+# confluence storage format macros, wiki markup macros and page chrome that carry no content
+BOILERPLATE_PATTERNS = [
+    re.compile(r"<ac:[^>]*/>|</?ac:[^>]*>|</?ri:[^>]*>", re.IGNORECASE),
+    re.compile(r"<!--.*?-->", re.DOTALL),
+    re.compile(r"\{(toc|children|pagetree|recently-updated|contentbylabel|excerpt-include|include|anchor|panel|info|note|tip|warning|expand|status)(:[^}]*)?\}", re.IGNORECASE),
+    re.compile(r"^\s*(skip to end of metadata|go to start of metadata|jump to:.*|table of contents|created by .*last (modified|updated).*|pages\s*/.*|edit\s*\|.*|like\s+be the first to like this.*|no labels)\s*$", re.IGNORECASE | re.MULTILINE),
+    re.compile(r"^\s*!\[[^\]]*\]\([^)]*\)\s*$", re.MULTILINE),  # image-only lines
+]
+
+STOPWORDS = set("""a an and are as at be by can do does for from how i in is it of on or our that the this to
+what when where which who why will with you your we me my about into there their them they was were has have""".split())
+
+SHINGLE_SIZE = 5
+DUPLICATE_OVERLAP = 0.7
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def strip_boilerplate(text: str) -> str:
+    for pattern in BOILERPLATE_PATTERNS:
+        text = pattern.sub("", text)
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def _terms(text: str) -> List[str]:
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS and len(t) > 1]
+
+
+def _shingles(text: str) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def relevance(query_terms: List[str], passage: str) -> float:
+    """Query term overlap, dampened by passage length (a small bm25-like score)."""
+    if not query_terms:
+        return 0.0
+    passage_terms = _terms(passage)
+    if not passage_terms:
+        return 0.0
+    counts: Dict[str, int] = {}
+    for term in passage_terms:
+        counts[term] = counts.get(term, 0) + 1
+    score = sum(counts[t] / (counts[t] + 1.2) for t in set(query_terms) if t in counts)
+    return score / math.sqrt(1 + len(passage_terms) / 100)
+
+
+def dedupe(passages: List[str]) -> List[int]:
+    """Indexes of passages that do not mostly repeat an earlier one."""
+    kept: List[int] = []
+    seen: List[set] = []
+    for index, passage in enumerate(passages):
+        shingles = _shingles(passage)
+        if not shingles:
+            continue
+        if any(len(shingles & other) / min(len(shingles), len(other)) >= DUPLICATE_OVERLAP for other in seen):
+            continue
+        kept.append(index)
+        seen.append(shingles)
+    return kept
+
+
+def select_passages(passages: List[str], query: str, budget_tokens: int, priors: Optional[List[float]] = None) -> List[int]:
+    """Pick the most relevant, non duplicated passages that fit the budget, in original order.
+
+    `priors` are upstream relevance scores (such as KB similarity) blended into the ranking.
+    A passage that does not fit whole is cut to the remaining budget if nothing else fits.
+    """
+    query_terms = _terms(query)
+    candidates = dedupe(passages)
+
+    def rank(index: int) -> float:
+        prior = priors[index] if priors else 0.0
+        return relevance(query_terms, passages[index]) + prior
+
+    chosen: List[int] = []
+    used = 0
+    for index in sorted(candidates, key=rank, reverse=True):
+        cost = estimate_tokens(passages[index])
+        if used + cost <= budget_tokens:
+            chosen.append(index)
+            used += cost
+    if not chosen and candidates:
+        best = max(candidates, key=rank)
+        passages[best] = passages[best][:budget_tokens * CHARS_PER_TOKEN]
+        chosen.append(best)
+    return sorted(chosen)
+
+
+## tool specific compressors. each takes the raw text of a result and returns the compressed text.
+
+RETRIEVE_RESULT_SPLIT = re.compile(r"\n(?=Score: [0-9.]+\n)")
+
+
+def compress_retrieve_text(text: str, query: str, budget_tokens: int) -> str:
+    # strands_tools.retrieve output: a header line then "Score / Document ID / Content" blocks
+    header, *blocks = RETRIEVE_RESULT_SPLIT.split(text)
+    if not blocks:
+        return text
+
+    sources, contents, priors = [], [], []
+    for block in blocks:
+        source, _, content = block.partition("Content: ")
+        score = re.match(r"Score: ([0-9.]+)", source)
+        sources.append(source.strip())
+        contents.append(strip_boilerplate(content))
+        priors.append(float(score.group(1)) if score else 0.0)
+
+    budget = max(budget_tokens - estimate_tokens(header) - sum(estimate_tokens(s) for s in sources), 1)
+    kept = select_passages(contents, query, budget, priors)
+    body = "\n".join(f"\n{sources[i]}\nContent: {contents[i]}\n" for i in kept)
+    return f"{header.strip()}\n(kept {len(kept)} of {len(blocks)} results after context compression)\n{body}"
+
+
+def _split_paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in re.split(r"\n\s*\n|\n(?=#+ )", text) if p.strip()]
+
+
+def compress_page_body(body: str, query: str, budget_tokens: int) -> str:
+    paragraphs = _split_paragraphs(strip_boilerplate(body))
+    kept = select_passages(paragraphs, query, budget_tokens)
+    omitted = len(paragraphs) - len(kept)
+    compressed = "\n\n".join(paragraphs[i] for i in kept)
+    if omitted:
+        compressed += f"\n\n[{omitted} less relevant sections omitted by context compression]"
+    return compressed
+
+
+def _compress_page_json(value: Any, query: str, budget_tokens: int) -> Any:
+    # only the page body is compressed. ids, titles, urls and other metadata are kept as is.
+    if isinstance(value, dict):
+        compressed = {}
+        for key, item in value.items():
+            if key in ("value", "body", "content") and isinstance(item, str):
+                compressed[key] = compress_page_body(item, query, budget_tokens)
+            else:
+                compressed[key] = _compress_page_json(item, query, budget_tokens)
+        return compressed
+    if isinstance(value, list):
+        return [_compress_page_json(item, query, budget_tokens) for item in value]
+    return value
+
+
+def compress_page_text(text: str, query: str, budget_tokens: int) -> str:
+    # mcp-atlassian returns the page as json (metadata + content). fall back to plain text.
+    try:
+        page = json.loads(text)
+    except ValueError:
+        return compress_page_body(text, query, budget_tokens)
+    return json.dumps(_compress_page_json(page, query, budget_tokens), ensure_ascii=False)
+
+
+COMPRESSORS = {
+    "retrieve": compress_retrieve_text,
+    "confluence_get_page": compress_page_text,
+}
+
+
+class ContextCompressor(HookProvider):
+    """Hook that compresses successful tool results that have a token budget.
+
+    `budgets` maps tool name to a token budget for that tool's result. Tools without a
+    budget, or without a compressor in COMPRESSORS, are passed through untouched.
+    """
+
+    def __init__(self, budgets: Dict[str, int], recent_calls: int = 100):
+        self.budgets = budgets
+        self.totals: Dict[str, Dict[str, int]] = {}
+        self.recent: deque = deque(maxlen=recent_calls)
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(AfterToolInvocationEvent, self.compress_result)
+
+    @staticmethod
+    def _query(event: AfterToolInvocationEvent) -> str:
+        # the tool's own query if it has one, plus the user's latest question
+        tool_input = event.tool_use.get("input") or {}
+        parts = [str(tool_input.get("text") or tool_input.get("query") or "")]
+        for message in reversed(event.agent.messages):
+            texts = [c["text"] for c in message.get("content", []) if "text" in c]
+            if message.get("role") == "user" and texts:
+                parts.append(" ".join(texts))
+                break
+        return " ".join(parts)
+
+    def compress_result(self, event: AfterToolInvocationEvent) -> None:
+        tool_name = event.tool_use["name"]
+        budget = self.budgets.get(tool_name)
+        compressor = COMPRESSORS.get(tool_name)
+        if budget is None or compressor is None or event.result.get("status") != "success":
+            return
+
+        query = self._query(event)
+        content: List[Dict[str, Any]] = []
+        before = after = 0
+        for block in event.result.get("content", []):
+            if "text" in block:
+                text = block["text"]
+                before += estimate_tokens(text)
+                if estimate_tokens(text) > budget:
+                    text = compressor(text, query, budget)
+                after += estimate_tokens(text)
+                content.append({**block, "text": text})
+            else:
+                content.append(block)
+
+        if after < before:
+            event.result = {**event.result, "content": content}
+        else:
+            after = before
+        self._record(tool_name, event.tool_use["toolUseId"], before, after)
+
+    def _record(self, tool_name: str, tool_use_id: str, before: int, after: int) -> None:
+        saved = before - after
+        logger.info(f"context compression | tool={tool_name} toolUseId={tool_use_id} tokens {before} -> {after} (saved {saved})")
+        totals = self.totals.setdefault(tool_name, {"calls": 0, "tokens_before": 0, "tokens_after": 0, "tokens_saved": 0})
+        totals["calls"] += 1
+        totals["tokens_before"] += before
+        totals["tokens_after"] += after
+        totals["tokens_saved"] += saved
+        self.recent.append({"tool_name": tool_name, "toolUseId": tool_use_id, "tokens_before": before,
+                            "tokens_after": after, "tokens_saved": saved})
+
+    def stats(self) -> Dict[str, Any]:
+        return {"budgets": self.budgets, "totals": self.totals, "recent": list(self.recent)}
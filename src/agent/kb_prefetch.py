@@ -0,0 +1,193 @@
+## Speculative knowledge base retrieval
+# The system prompt makes the agent call `retrieve` for every query, so each turn spends a full
+# model round trip only to ask for a retrieval it was always going to do. With prefetch on, a
+# retrieve for the raw user query starts together with the first model call. If the model then
+# asks for `retrieve` with an equivalent query, the prefetched result is served; otherwise the
+# prefetch is discarded.
+
+import asyncio
+import logging
+import os
+import re
+import time
+from typing import Any, Callable, Dict, Optional
+
+from strands.experimental.hooks import BeforeToolInvocationEvent
+from strands.hooks import HookProvider, HookRegistry
+from strands.types.tools import AgentTool, ToolGenerator, ToolResult, ToolUse
+
+logger = logging.getLogger(__name__)
+
+KB_TOOL_NAME = "retrieve"
+
+# key under which the turn's prefetch travels in the agent invocation state
+INVOCATION_STATE_KEY = "kb_prefetch"
+
+QUERY_OVERLAP = 0.8
+
+
+def _retrieve_defaults() -> Dict[str, Any]:
+    # the values strands_tools.retrieve falls back to when a parameter is not given
+    return {
+        "numberOfResults": 10,
+        "score": float(os.getenv("MIN_SCORE", "0.4")),
+        "knowledgeBaseId": os.getenv("KNOWLEDGE_BASE_ID"),
+        "region": os.getenv("AWS_REGION", "us-west-2"),
+    }
+
+
+def _query_terms(text: str) -> set:
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def equivalent_retrieve(prefetch_input: Dict[str, Any], tool_input: Dict[str, Any]) -> bool:
+    """Whether a prefetched retrieve can answer the model's retrieve call.
+
+    Queries match when their word sets overlap by at least QUERY_OVERLAP (jaccard), and
+    every other parameter resolves to the same value once retrieve's defaults are applied.
+    """
+    defaults = _retrieve_defaults()
+
+    def params(value: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in value.items() if k != "text" and defaults.get(k, object()) != v}
+
+    if params(prefetch_input) != params(tool_input):
+        return False
+    a, b = _query_terms(prefetch_input.get("text", "")), _query_terms(str(tool_input.get("text", "")))
+    if not a or not b:
+        return False
+    return len(a & b) / len(a | b) >= QUERY_OVERLAP
+
+
+class KBPrefetch:
+    """One in-flight speculative retrieve, owned by a single turn."""
+
+    def __init__(self, tool_input: Dict[str, Any], task: "asyncio.Task[ToolResult]"):
+        self.tool_input = tool_input
+        self.task = task
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.claimed_at: Optional[float] = None
+        self.outcome = "unused"  # unused | hit | miss
+        task.add_done_callback(lambda _: setattr(self, "finished_at", time.time()))
+
+    def claim(self, tool_input: Dict[str, Any]) -> bool:
+        # only the first retrieve of the turn is compared with the prefetch
+        if self.outcome != "unused":
+            return False
+        self.claimed_at = time.time()
+        self.outcome = "hit" if equivalent_retrieve(self.tool_input, tool_input) else "miss"
+        return self.outcome == "hit"
+
+
+class PrefetchedRetrieve(AgentTool):
+    """Serves a retrieve call from the turn's prefetch, falling back to the real tool on failure.
+
+    The limiter wraps it like any retrieve, so while it waits for a bounded prefetch both take
+    a kb slot. The cap is never exceeded, only briefly counted twice.
+    """
+
+    def __init__(self, tool: AgentTool, prefetch: KBPrefetch):
+        super().__init__()
+        self._tool = tool
+        self._prefetch = prefetch
+
+    @property
+    def tool_name(self) -> str:
+        return self._tool.tool_name
+
+    @property
+    def tool_spec(self):
+        return self._tool.tool_spec
+
+    @property
+    def tool_type(self) -> str:
+        return self._tool.tool_type
+
+    async def stream(self, tool_use: ToolUse, invocation_state: Dict[str, Any], **kwargs: Any) -> ToolGenerator:
+        try:
+            result = await self._prefetch.task
+        except Exception as e:
+            logger.warning(f"kb prefetch failed, running retrieve again: {e}")
+            result = None
+
+        if result is None or result.get("status") != "success":
+            async for event in self._tool.stream(tool_use, invocation_state, **kwargs):
+                yield event
+            return
+
+        yield {**result, "toolUseId": tool_use["toolUseId"]}
+
+
+class KBPrefetcher(HookProvider):
+    """Starts speculative retrieves and serves them to matching `retrieve` calls.
+
+    `params` are extra retrieve parameters used for every prefetch (such as numberOfResults).
+    `bound` wraps the retrieve tool for a prefetch, e.g. ToolConcurrencyLimiter.bound, so the
+    prefetch counts against the kb concurrency cap and timeout like any other retrieve.
+    """
+
+    def __init__(self, params: Optional[Dict[str, Any]] = None, bound: Optional[Callable[[AgentTool], AgentTool]] = None):
+        self.params = params or {}
+        self.bound = bound
+        self.counts = {"prefetched": 0, "hit": 0, "miss": 0, "unused": 0, "failed": 0}
+        self.ttft_saved_seconds = 0.0
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(BeforeToolInvocationEvent, self.serve_prefetch)
+
+    def start(self, agent, query: str) -> Optional[KBPrefetch]:
+        """Start a retrieve for the raw user query. Must be called from the event loop."""
+        tool = agent.tool_registry.registry.get(KB_TOOL_NAME)
+        if tool is None:
+            return None
+        if self.bound:
+            tool = self.bound(tool)
+
+        tool_input = {"text": query, **self.params}
+        tool_use: ToolUse = {"toolUseId": f"kb_prefetch_{time.time_ns()}", "name": KB_TOOL_NAME, "input": tool_input}
+
+        async def run() -> ToolResult:
+            # the last event is the result; status events of a bound tool are not shown for a prefetch
+            result = None
+            async for event in tool.stream(tool_use, {}):
+                result = event
+            return result
+
+        self.counts["prefetched"] += 1
+        return KBPrefetch(tool_input, asyncio.create_task(run()))
+
+    def serve_prefetch(self, event: BeforeToolInvocationEvent) -> None:
+        prefetch = event.invocation_state.get(INVOCATION_STATE_KEY)
+        if prefetch is None or event.selected_tool is None or event.tool_use["name"] != KB_TOOL_NAME:
+            return
+        if prefetch.claim(event.tool_use.get("input") or {}):
+            event.selected_tool = PrefetchedRetrieve(event.selected_tool, prefetch)
+
+    def finish(self, prefetch: Optional[KBPrefetch]) -> None:
+        """Account for a turn's prefetch once the turn is over and drop it if it was not used."""
+        if prefetch is None:
+            return
+        if not prefetch.task.done():
+            prefetch.task.cancel()
+        elif prefetch.task.cancelled() or prefetch.task.exception() is not None:
+            self.counts["failed"] += 1
+
+        self.counts[prefetch.outcome] += 1
+        if prefetch.outcome == "hit" and prefetch.finished_at is not None:
+            # without prefetch the retrieve would have started at claim time and taken as long as the prefetch did
+            duration = prefetch.finished_at - prefetch.started_at
+            saved = (prefetch.claimed_at + duration) - max(prefetch.claimed_at, prefetch.finished_at)
+            self.ttft_saved_seconds += saved
+            logger.info(f"kb prefetch hit | saved {saved * 1000:.0f} ms")
+        else:
+            logger.info(f"kb prefetch {prefetch.outcome}")
+
+    def stats(self) -> Dict[str, Any]:
+        decided = self.counts["hit"] + self.counts["miss"] + self.counts["unused"]
+        return {
+            **self.counts,
+            "hit_rate": self.counts["hit"] / decided if decided else None,
+            "ttft_saved_seconds_total": round(self.ttft_saved_seconds, 3),
+            "ttft_saved_seconds_per_hit": round(self.ttft_saved_seconds / self.counts["hit"], 3) if self.counts["hit"] else None,
+        }
@@ -0,0 +1,70 @@
+## Knowledge base retrieve tool on the shared AWS client
+# Same tool spec, parameters and output as strands_tools.retrieve, which builds a new
+# bedrock-agent-runtime client on every call. This version takes its client from the
+# AWSClientFactory so the connection pool is kept warm between calls.
+
+import os
+from typing import Any, Optional
+
+from strands.tools.tools import PythonAgentTool
+from strands.types.tools import ToolResult, ToolUse
+from strands_tools.retrieve import TOOL_SPEC, _validate_filter, filter_results_by_score, format_results_for_display
+
+from aws_clients import AWSClientFactory
+
+
+def make_retrieve_tool(client_factory: AWSClientFactory, endpoint_url: Optional[str] = None) -> PythonAgentTool:
+    """Build the `retrieve` tool bound to the given client factory."""
+
+    def retrieve(tool: ToolUse, **kwargs: Any) -> ToolResult:
+        default_knowledge_base_id = os.getenv("KNOWLEDGE_BASE_ID")
+        default_aws_region = os.getenv("AWS_REGION", "us-west-2")
+        default_min_score = float(os.getenv("MIN_SCORE", "0.4"))
+        tool_use_id = tool["toolUseId"]
+        tool_input = tool["input"]
+
+        try:
+            query = tool_input["text"]
+            number_of_results = tool_input.get("numberOfResults", 10)
+            kb_id = tool_input.get("knowledgeBaseId", default_knowledge_base_id)
+            region_name = tool_input.get("region", default_aws_region)
+            min_score = tool_input.get("score", default_min_score)
+            retrieve_filter = tool_input.get("retrieveFilter")
+
+            client = client_factory.client(
+                "bedrock-agent-runtime",
+                region_name=region_name,
+                profile_name=tool_input.get("profile_name"),
+                endpoint_url=endpoint_url,
+            )
+
+            retrieval_config = {"vectorSearchConfiguration": {"numberOfResults": number_of_results}}
+            if retrieve_filter:
+                try:
+                    if _validate_filter(retrieve_filter):
+                        retrieval_config["vectorSearchConfiguration"]["filter"] = retrieve_filter
+                except ValueError as e:
+                    return {"toolUseId": tool_use_id, "status": "error", "content": [{"text": str(e)}]}
+
+            response = client.retrieve(
+                retrievalQuery={"text": query}, knowledgeBaseId=kb_id, retrievalConfiguration=retrieval_config
+            )
+
+            filtered_results = filter_results_by_score(response.get("retrievalResults", []), min_score)
+            formatted_results = format_results_for_display(filtered_results)
+            return {
+                "toolUseId": tool_use_id,
+                "status": "success",
+                "content": [
+                    {"text": f"Retrieved {len(filtered_results)} results with score >= {min_score}:\n{formatted_results}"}
+                ],
+            }
+
+        except Exception as e:
+            return {
+                "toolUseId": tool_use_id,
+                "status": "error",
+                "content": [{"text": f"Error during retrieval: {str(e)}"}],
+            }
+
+    return PythonAgentTool("retrieve", TOOL_SPEC, retrieve)
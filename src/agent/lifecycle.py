@@ -0,0 +1,172 @@
+## Hot reload of the agent config and graceful drain of chat turns
+# The prompt, model and tools that agents are built from form one AgentConfig generation. A
+# reload builds the next generation completely and then swaps it in with one assignment: new
+# turns get agents built from it, turns already running keep the generation they started on.
+# A retired generation releases its resources (such as its MCP client) once its last turn ends.
+# On shutdown TurnDrain refuses new turns and gives the running ones a deadline to finish.
+
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class AgentConfig:
+    """One generation of the settings, prompt, model and tools that agents are built from.
+
+    `close` releases what only this generation owns. It runs once the generation is retired
+    and no turn uses it any more.
+    """
+
+    def __init__(self, version: int, settings: Dict[str, Any], system_prompt: str, model: Any, tools: List[Any],
+                 mcp_tools: Optional[List[Any]] = None, close: Optional[Callable[[], None]] = None):
+        self.version = version
+        self.settings = settings
+        self.system_prompt = system_prompt
+        self.model = model
+        self.tools = tools
+        self.mcp_tools = mcp_tools or []
+        self.close = close
+        self.created_at = time.time()
+        self.active_turns = 0
+        self.retired = False
+
+    def hand_over(self) -> Optional[Callable[[], None]]:
+        """Give this generation's resources to its successor, which then closes them."""
+        close, self.close = self.close, None
+        return close
+
+    def info(self) -> Dict[str, Any]:
+        return {"version": self.version, "settings": self.settings, "created_at": self.created_at,
+                "active_turns": self.active_turns, "retired": self.retired}
+
+
+class ConfigGenerations:
+    """Holds the current AgentConfig and the retired ones that still have turns running."""
+
+    def __init__(self, initial: AgentConfig):
+        self.current = initial
+        self.retired: List[AgentConfig] = []
+        self._swap_lock: Optional[asyncio.Lock] = None
+
+    @contextmanager
+    def pin(self) -> Iterator[AgentConfig]:
+        """Use the current generation for one turn, even if a reload swaps it meanwhile."""
+        config = self.current
+        config.active_turns += 1
+        try:
+            yield config
+        finally:
+            config.active_turns -= 1
+            self._release(config)
+
+    async def swap(self, build: Callable[[AgentConfig], AgentConfig]) -> AgentConfig:
+        """Build the next generation from the current one (in a thread, it may block) and swap it in."""
+        if self._swap_lock is None:
+            self._swap_lock = asyncio.Lock()
+        async with self._swap_lock:
+            new = await asyncio.to_thread(build, self.current)
+            old, self.current = self.current, new
+            old.retired = True
+            self.retired.append(old)
+            logger.info(f"agent config {new.version} is live, {old.version} retires after {old.active_turns} running turns")
+            self._release(old)
+            return new
+
+    def _release(self, config: AgentConfig) -> None:
+        if not config.retired or config.active_turns > 0:
+            return
+        if config in self.retired:
+            self.retired.remove(config)
+        close = config.hand_over()
+        if close is None:
+            return
+        try:
+            # closing an mcp client joins its thread; keep that off the event loop
+            asyncio.get_running_loop().run_in_executor(None, close)
+        except RuntimeError:
+            close()
+
+    def close_all(self) -> None:
+        """Release every generation's resources, at shutdown."""
+        for config in self.retired + [self.current]:
+            close = config.hand_over()
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    logger.exception(f"closing agent config {config.version} failed")
+
+
+class ServerDraining(Exception):
+    """A new turn was refused because the server is shutting down."""
+
+
+class TurnReservation:
+    """A turn admitted before its task runs, e.g. while the SSE response is being set up."""
+
+    def __init__(self, drain: "TurnDrain"):
+        self._drain = drain
+        self.open = True
+
+    def release(self) -> None:
+        if self.open:
+            self.open = False
+            self._drain._reserved.discard(self)
+
+
+class TurnDrain:
+    """Tracks the tasks running chat turns so shutdown can wait for them."""
+
+    def __init__(self):
+        self.draining = False
+        self._turns: Set[asyncio.Task] = set()
+        self._reserved: Set[TurnReservation] = set()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._turns) + len(self._reserved)
+
+    def reserve(self) -> TurnReservation:
+        """Admit a turn now, so it is refused (or not) before a response is started. Drain waits for it."""
+        if self.draining:
+            raise ServerDraining("The server is shutting down, retry on another instance")
+        reservation = TurnReservation(self)
+        self._reserved.add(reservation)
+        return reservation
+
+    @contextmanager
+    def turn(self, reservation: Optional[TurnReservation] = None) -> Iterator[None]:
+        """Track the running turn. A turn with an open reservation is admitted even while draining."""
+        if reservation is not None and reservation.open:
+            reservation.release()
+        elif self.draining:
+            raise ServerDraining("The server is shutting down, retry on another instance")
+        task = asyncio.current_task()
+        self._turns.add(task)
+        try:
+            yield
+        finally:
+            self._turns.discard(task)
+
+    async def drain(self, deadline_seconds: float) -> Dict[str, Any]:
+        """Refuse new turns, wait up to `deadline_seconds` for running ones, then cancel the rest."""
+        self.draining = True
+        started = time.monotonic()
+        waiting = self.in_flight
+        if waiting:
+            logger.info(f"draining {waiting} running turns, deadline {deadline_seconds}s")
+        while self.in_flight and time.monotonic() - started < deadline_seconds:
+            await asyncio.sleep(0.1)
+
+        cancelled = list(self._turns)
+        for task in cancelled:
+            task.cancel()
+        for reservation in list(self._reserved):
+            reservation.release()  # never started; it is refused when it does
+        if cancelled:
+            logger.warning(f"drain deadline passed, cancelled {len(cancelled)} turns")
+        return {"waited_for": waiting, "cancelled": len(cancelled), "seconds": round(time.monotonic() - started, 2)}
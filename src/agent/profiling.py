@@ -0,0 +1,202 @@
+## On-demand profiling of the agent API hot path
+# Nothing here runs unless it is switched on: a chat request is only wrapped when profiling was
+# asked for (header or admin endpoint), and the event loop lag monitor only starts when given a
+# threshold. Profile dumps go to one directory that is trimmed to a size limit, oldest first.
+
+import asyncio
+import cProfile
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+class ProfileStore:
+    """Writes profile dumps to a directory and keeps its total size under `max_bytes`."""
+
+    def __init__(self, directory: str, max_bytes: int = 50 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def path_for(self, label: str, extension: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)[:80]
+        return os.path.join(self.directory, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{safe_label}.{extension}")
+
+    def list(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.directory):
+            return []
+        entries = [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+        files = [e for e in entries if os.path.isfile(e)]
+        return [{"file": os.path.basename(f), "bytes": os.path.getsize(f)} for f in sorted(files, key=os.path.getmtime)]
+
+    def rotate(self) -> None:
+        with self._lock:
+            files = sorted((os.path.join(self.directory, f["file"]) for f in self.list()), key=os.path.getmtime)
+            total = sum(os.path.getsize(f) for f in files)
+            while files and total > self.max_bytes:
+                oldest = files.pop(0)
+                total -= os.path.getsize(oldest)
+                os.remove(oldest)
+
+
+class StackSampler:
+    """Samples the stacks of all threads at a fixed interval into folded (flamegraph) format."""
+
+    def __init__(self, interval_seconds: float = 0.005):
+        self.interval_seconds = interval_seconds
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval_seconds):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = [f"{f.f_code.co_name} ({os.path.basename(f.f_code.co_filename)}:{f.f_code.co_firstlineno})"
+                         for f, _ in traceback.walk_stack(frame)]
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    """Profiles single chat requests on demand.
+
+    `cprofile` records every Python call while the request runs (SSE serialization, tool input
+    parsing, session file I/O, ...), including those of requests running at the same time. The
+    interpreter allows one active profiler, so a concurrent cProfile request falls back to
+    `sample`, which samples the stacks of every thread.
+    """
+
+    def __init__(self, store: ProfileStore, sample_interval_seconds: float = 0.005):
+        self.store = store
+        self.sample_interval_seconds = sample_interval_seconds
+        self.armed_mode: Optional[str] = None
+        self.armed_requests = 0
+        self._cprofile_active = False
+
+    def arm(self, mode: Optional[str], requests: int = 1) -> None:
+        """Profile the next `requests` chat requests with `mode` (None disarms)."""
+        self.armed_mode = mode
+        self.armed_requests = requests if mode else 0
+
+    def mode_for(self, header_mode: Optional[str]) -> Optional[str]:
+        if header_mode in PROFILE_MODES:
+            return header_mode
+        if self.armed_requests > 0:
+            self.armed_requests -= 1
+            return self.armed_mode
+        return None
+
+    async def profile(self, events: AsyncIterator[Any], mode: str, label: str) -> AsyncIterator[Any]:
+        if mode == "cprofile" and self._cprofile_active:
+            mode = "sample"
+
+        started = time.perf_counter()
+        if mode == "cprofile":
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self._cprofile_active = True
+            except ValueError:  # another profiler (e.g. a debugger) is active
+                mode = "sample"
+        if mode == "sample":
+            sampler = StackSampler(self.sample_interval_seconds)
+            sampler.start()
+
+        try:
+            async for event in events:
+                yield event
+        finally:
+            if mode == "cprofile":
+                profiler.disable()
+                self._cprofile_active = False
+                path = self.store.path_for(label, "prof")
+                profiler.dump_stats(path)
+            else:
+                sampler.stop()
+                path = self.store.path_for(label, "folded")
+                sampler.dump(path)
+            self.store.rotate()
+            logger.info(f"profile ({mode}) of {label} took {time.perf_counter() - started:.2f}s, written to {path}")
+
+
+class LoopLagMonitor:
+    """Logs the event loop's stack whenever the loop is blocked longer than the threshold.
+
+    A coroutine on the loop records a heartbeat every `interval`; a watchdog thread notices
+    when the heartbeat stops and logs what the loop thread is running at that moment.
+    """
+
+    def __init__(self, threshold_seconds: float, interval_seconds: float = 0.05):
+        self.threshold_seconds = threshold_seconds
+        self.interval_seconds = interval_seconds
+        self.stalls = 0
+        self.max_lag_seconds = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+
+    async def _beat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval_seconds
+            await asyncio.sleep(self.interval_seconds)
+            self._heartbeat = time.monotonic()
+            lag = self._heartbeat - expected
+            self.max_lag_seconds = max(self.max_lag_seconds, lag)
+
+    def _watch(self) -> None:
+        reported = None
+        while not self._stop.wait(self.interval_seconds):
+            blocked = time.monotonic() - self._heartbeat
+            if blocked < self.threshold_seconds or reported == self._heartbeat:
+                continue
+            reported = self._heartbeat  # one report per stall
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "(loop thread not found)\n"
+            logger.warning(f"event loop blocked for {blocked * 1000:.0f} ms, loop thread is running:\n{stack}")
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._task = loop.create_task(self._beat())
+        threading.Thread(target=self._watch, name="loop-lag-monitor", daemon=True).start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"threshold_ms": self.threshold_seconds * 1000, "stalls": self.stalls,
+                "max_lag_ms": round(self.max_lag_seconds * 1000, 1)}
@@ -0,0 +1,196 @@
+## Bounded parallel tool execution
+# Strands already schedules every tool use of a cycle as its own asyncio task. This module
+# puts a per tool class concurrency cap and a per call timeout around each of those tasks,
+# and reports when a call really starts and finishes so the SSE stream can show it.
+# A call that times out is answered at once, but keeps its slot in the class until it really ends.
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional, Set
+
+from pydantic import BaseModel, Field
+from strands.experimental.hooks import BeforeToolInvocationEvent
+from strands.hooks import HookProvider, HookRegistry
+from strands.tools.mcp import MCPAgentTool
+from strands.types.tools import AgentTool, ToolGenerator, ToolResult, ToolUse
+
+logger = logging.getLogger(__name__)
+
+# tools answered by the bedrock knowledge base. every mcp tool falls into the "mcp" class.
+KB_TOOL_NAMES = {"retrieve"}
+
+_CALL_DONE = object()  # queued after the last event of a call
+
+# calls still running after their turn stopped waiting (timeout or cancelled turn), kept referenced until they end
+_running_calls: Set[asyncio.Task] = set()
+
+
+class ToolClassLimit(BaseModel):
+    """Concurrency cap and per call timeout for one class of tools."""
+    max_concurrency: int = Field(default=4, ge=1)
+    timeout_seconds: Optional[float] = Field(default=60.0, gt=0)
+
+
+def tool_class_of(tool: AgentTool) -> str:
+    """Map a tool to the class its limits are configured under."""
+    if isinstance(tool, MCPAgentTool):
+        return "mcp"
+    if tool.tool_name in KB_TOOL_NAMES:
+        return "kb"
+    return "default"
+
+
+class BoundedTool(AgentTool):
+    """Wraps a tool so its calls respect the class semaphore and timeout.
+
+    The wrapped call runs as its own task and holds the semaphore until it finishes. After a
+    timeout the model gets an error result at once, while the call (a sync tool's thread, an
+    mcp request on the pipe) still counts against the class cap until it really ends.
+    Events of the wrapped tool are passed on as they arrive.
+    """
+
+    def __init__(self, tool: AgentTool, tool_class: str, semaphore: asyncio.Semaphore, timeout_seconds: Optional[float]):
+        super().__init__()
+        self._tool = tool
+        self._tool_class = tool_class
+        self._semaphore = semaphore
+        self._timeout_seconds = timeout_seconds
+
+    @property
+    def tool_name(self) -> str:
+        return self._tool.tool_name
+
+    @property
+    def tool_spec(self):
+        return self._tool.tool_spec
+
+    @property
+    def tool_type(self) -> str:
+        return self._tool.tool_type
+
+    def _status_event(self, tool_use: ToolUse, invocation_state: Dict[str, Any], state: str,
+                      started_at: float, finished_at: Optional[float] = None) -> Dict[str, Any]:
+        # events carrying a "callback" key are passed through by Agent.stream_async
+        return {"callback": {"tool_status": {
+            "event_loop_cycle_id": invocation_state.get("event_loop_cycle_id"),
+            "tool_name": self.tool_name,
+            "toolUseId": tool_use["toolUseId"],
+            "tool_input": tool_use.get("input") or {},
+            "tool_class": self._tool_class,
+            "state": state,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }}}
+
+    async def _forward(self, tool_use: ToolUse, invocation_state: Dict[str, Any], events: asyncio.Queue, **kwargs: Any) -> None:
+        async for event in self._tool.stream(tool_use, invocation_state, **kwargs):
+            events.put_nowait(event)
+
+    def _call_finished(self, call: asyncio.Task, events: asyncio.Queue) -> None:
+        self._semaphore.release()
+        _running_calls.discard(call)
+        events.put_nowait(_CALL_DONE)
+
+    async def stream(self, tool_use: ToolUse, invocation_state: Dict[str, Any], **kwargs: Any) -> ToolGenerator:
+        await self._semaphore.acquire()
+        events: asyncio.Queue = asyncio.Queue()
+        call = asyncio.create_task(self._forward(tool_use, invocation_state, events, **kwargs))
+        _running_calls.add(call)
+        call.add_done_callback(lambda _: self._call_finished(call, events))
+
+        started_at = time.time()
+        deadline = None if self._timeout_seconds is None else time.monotonic() + self._timeout_seconds
+        yield self._status_event(tool_use, invocation_state, "running", started_at)
+
+        try:
+            # the last event of the call is its result, so every event is passed on once the next one arrived
+            result: Optional[ToolResult] = None
+            while True:
+                timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+                event = await asyncio.wait_for(events.get(), timeout=timeout)
+                if event is _CALL_DONE:
+                    break
+                if result is not None:
+                    yield result
+                result = event
+            call.result()  # raises what the tool raised
+            if result is None:
+                raise RuntimeError(f"tool {self.tool_name} returned no result")
+            state = "done" if result.get("status") == "success" else "error"
+        except asyncio.TimeoutError:
+            logger.warning(f"tool {self.tool_name} ({tool_use['toolUseId']}) timed out after {self._timeout_seconds}s,"
+                           f" its {self._tool_class} slot stays taken until it ends")
+            result = {
+                "toolUseId": tool_use["toolUseId"],
+                "status": "error",
+                "content": [{"json": {
+                    "error": "timeout",
+                    "tool_name": self.tool_name,
+                    "timeout_seconds": self._timeout_seconds,
+                    "message": "The tool did not answer in time. Answer with the information you have or try a narrower request.",
+                }}],
+            }
+            state = "timeout"
+        except (Exception, asyncio.CancelledError):
+            # strands turns the exception into an error result, the stream still has to see the call end
+            yield self._status_event(tool_use, invocation_state, "error", started_at, time.time())
+            raise
+
+        finished_at = time.time()
+        yield self._status_event(tool_use, invocation_state, state, started_at, finished_at)
+        yield result
+
+
+class ToolConcurrencyLimiter(HookProvider):
+    """Hook that swaps every selected tool for a BoundedTool of its class.
+
+    `executor_workers` sizes the thread pool used by sync tools (such as `retrieve`), which
+    strands runs through `asyncio.to_thread` on the event loop's default executor.
+    """
+
+    def __init__(self, limits: Dict[str, ToolClassLimit], executor_workers: int = 16,
+                 tool_classes: Optional[Dict[str, str]] = None):
+        self.limits = {"default": ToolClassLimit(), **limits}
+        self.tool_classes = tool_classes or {}  # tool name -> class, overrides tool_class_of
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers, thread_name_prefix="tool")
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(BeforeToolInvocationEvent, self.bound_tool)
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Use the tool thread pool as the default executor of the given loop."""
+        loop.set_default_executor(self.executor)
+
+    def _semaphore(self, tool_class: str) -> asyncio.Semaphore:
+        # semaphores belong to a loop, so start fresh if the agent moved to another one
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphores = {}
+        if tool_class not in self._semaphores:
+            self._semaphores[tool_class] = asyncio.Semaphore(self.limits[tool_class].max_concurrency)
+        return self._semaphores[tool_class]
+
+    def bound(self, tool: AgentTool) -> AgentTool:
+        """Wrap a tool in the limits of its class. Also used for calls outside the agent, such as the kb prefetch."""
+        if isinstance(tool, BoundedTool):
+            return tool
+
+        tool_class = self.tool_classes.get(tool.tool_name) or tool_class_of(tool)
+        if tool_class not in self.limits:
+            tool_class = "default"
+
+        return BoundedTool(
+            tool,
+            tool_class=tool_class,
+            semaphore=self._semaphore(tool_class),
+            timeout_seconds=self.limits[tool_class].timeout_seconds,
+        )
+
+    def bound_tool(self, event: BeforeToolInvocationEvent) -> None:
+        if event.selected_tool is not None:
+            event.selected_tool = self.bound(event.selected_tool)
@@ -0,0 +1,343 @@
+## Record and replay of agent turns
+# Recording writes one gzipped JSON trace per chat turn: the stream events of every model call,
+# the input, raw result and timing of every tool call, and the chat events the client received.
+# Replay serves a turn from its trace (ReplayModel and ReplayTool) so chat_endpoint can be run
+# without Bedrock, the knowledge base or Confluence, at recorded or accelerated speed.
+# benchmarks/replay_turns.py drives the replay and compares output, CPU and memory.
+#
+# The turn being recorded or replayed travels in a context variable: the model is called
+# without the agent's invocation state, and tool tasks inherit the turn's context.
+
+import asyncio
+import copy
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, AsyncIterable, Dict, Iterator, List, Optional
+
+from strands.experimental.hooks import AfterToolInvocationEvent, BeforeToolInvocationEvent
+from strands.hooks import HookProvider, HookRegistry
+from strands.models import Model
+from strands.types.tools import AgentTool, ToolGenerator, ToolUse
+
+from tool_execution import tool_class_of
+
+logger = logging.getLogger(__name__)
+
+TRACE_VERSION = 1
+
+current_turn: ContextVar[Optional[Any]] = ContextVar("current_turn", default=None)
+
+
+@contextmanager
+def _as_current_turn(turn: Any) -> Iterator[None]:
+    token = current_turn.set(turn)
+    try:
+        yield
+    finally:
+        current_turn.reset(token)
+
+
+def _elapsed_ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 1)
+
+
+## RECORDING
+class TurnTrace:
+    """Everything one turn did, in the format written to disk."""
+
+    def __init__(self, session_id: str, query: str, prefetch_kb: bool):
+        self.started = time.perf_counter()
+        self.data: Dict[str, Any] = {
+            "version": TRACE_VERSION,
+            "session_id": session_id,
+            "query": query,
+            "prefetch_kb": prefetch_kb,
+            "recorded_at": time.time(),
+            "status": "ok",
+            "tool_specs": None,
+            "tool_classes": {},
+            "model_calls": [],  # {"offset_ms", "events": [[ms since previous event, event], ...]}
+            "tool_calls": {},   # toolUseId -> {"name", "input", "offset_ms", "duration_ms", "result"}
+            "output": [],       # [offset_ms, event, data]
+        }
+
+    def add_output(self, chat_event) -> None:
+        self.data["output"].append([_elapsed_ms(self.started), chat_event.event, chat_event.data.dict()])
+
+
+class RecordingModel(Model):
+    """Passes calls through to the wrapped model and records its stream events for the current turn."""
+
+    def __init__(self, model: Model):
+        self.model = model
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.model, name)
+
+    def update_config(self, **model_config: Any) -> None:
+        self.model.update_config(**model_config)
+
+    def get_config(self) -> Any:
+        return self.model.get_config()
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        async for event in self.model.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs):
+            yield event
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs: Any) -> AsyncIterable[Dict[str, Any]]:
+        trace = current_turn.get()
+        if not isinstance(trace, TurnTrace):
+            async for event in self.model.stream(messages, tool_specs, system_prompt, **kwargs):
+                yield event
+            return
+
+        if trace.data["tool_specs"] is None:
+            trace.data["tool_specs"] = tool_specs or []
+        call = {"offset_ms": _elapsed_ms(trace.started), "events": []}
+        trace.data["model_calls"].append(call)
+        last = time.perf_counter()
+        async for event in self.model.stream(messages, tool_specs, system_prompt, **kwargs):
+            call["events"].append([_elapsed_ms(last), event])
+            last = time.perf_counter()
+            yield event
+
+
+class TurnRecorder(HookProvider):
+    """Records every turn into `directory`, one `.json.gz` file per turn.
+
+    Register it as the last hook of the agent: after-tool callbacks run in reverse order,
+    so it sees the raw tool result before context compression rewrites it. Finished traces
+    are written by one writer thread, off the event loop; `close()` waits for pending writes.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._tool_started: Dict[str, float] = {}
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="turn-recorder")
+
+    def register_hooks(self, registry: HookRegistry, **kwargs: Any) -> None:
+        registry.add_callback(BeforeToolInvocationEvent, self.record_tool_input)
+        registry.add_callback(AfterToolInvocationEvent, self.record_tool_result)
+
+    def wrap_model(self, model: Model) -> RecordingModel:
+        return RecordingModel(model)
+
+    @contextmanager
+    def turn(self, session_id: str, query: str, prefetch_kb: bool) -> Iterator[TurnTrace]:
+        trace = TurnTrace(session_id, query, prefetch_kb)
+        try:
+            with _as_current_turn(trace):
+                yield trace
+        except (asyncio.CancelledError, GeneratorExit):  # client went away mid turn
+            trace.data["status"] = "cancelled"
+            raise
+        except Exception:
+            trace.data["status"] = "error"
+            raise
+        finally:
+            trace.data["duration_ms"] = _elapsed_ms(trace.started)
+            self._writer.submit(self.write, trace).add_done_callback(self._write_finished)
+
+    def _write_finished(self, write: Future) -> None:
+        if write.exception() is not None:
+            logger.error(f"could not write turn trace: {write.exception()!r}")
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+
+    def write(self, trace: TurnTrace) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        safe_session = "".join(c if c.isalnum() or c in "-_" else "_" for c in trace.data["session_id"])[:60]
+        path = os.path.join(self.directory, f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{safe_session}.json.gz")
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(trace.data, f, separators=(",", ":"), default=str)
+        logger.info(f"turn recorded to {path}")
+        return path
+
+    def record_tool_input(self, event: BeforeToolInvocationEvent) -> None:
+        trace = current_turn.get()
+        if not isinstance(trace, TurnTrace):
+            return
+        tool_use = event.tool_use
+        registered = event.agent.tool_registry.registry.get(tool_use["name"])
+        if registered is not None:
+            trace.data["tool_classes"][tool_use["name"]] = tool_class_of(registered)
+        trace.data["tool_calls"][tool_use["toolUseId"]] = {
+            "name": tool_use["name"],
+            "input": tool_use.get("input"),
+            "offset_ms": _elapsed_ms(trace.started),
+        }
+        self._tool_started[tool_use["toolUseId"]] = time.perf_counter()
+
+    def record_tool_result(self, event: AfterToolInvocationEvent) -> None:
+        trace = current_turn.get()
+        if not isinstance(trace, TurnTrace):
+            return
+        tool_use_id = event.tool_use["toolUseId"]
+        call = trace.data["tool_calls"].get(tool_use_id)
+        started = self._tool_started.pop(tool_use_id, None)
+        if call is None or started is None:
+            return
+        call["duration_ms"] = _elapsed_ms(started)
+        call["result"] = copy.deepcopy(event.result)  # later hooks may rewrite it
+
+
+def load_traces(directory: str) -> List[Dict[str, Any]]:
+    """All completed traces in `directory`, oldest first."""
+    traces = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".json.gz"):
+            continue
+        with gzip.open(os.path.join(directory, name), "rt", encoding="utf-8") as f:
+            trace = json.load(f)
+        if trace.get("version") != TRACE_VERSION or trace.get("status") != "ok":
+            logger.info(f"skipping trace {name} ({trace.get('status')})")
+            continue
+        trace["file"] = name
+        traces.append(trace)
+    return sorted(traces, key=lambda t: t["recorded_at"])
+
+
+## REPLAY
+class ReplayTurn:
+    """Replay state of one turn: the model calls still to be served and the recorded tool calls."""
+
+    def __init__(self, trace: Dict[str, Any]):
+        self.trace = trace
+        self.model_calls = deque(trace["model_calls"])
+        self.tool_calls = dict(trace["tool_calls"])
+
+    def next_model_call(self) -> Dict[str, Any]:
+        if not self.model_calls:
+            raise RuntimeError(f"trace {self.trace.get('file')} has no more recorded model calls")
+        return self.model_calls.popleft()
+
+    def tool_call(self, tool_use: ToolUse) -> Optional[Dict[str, Any]]:
+        # tool use ids come from the recorded model stream. the kb prefetch makes up its own id,
+        # so it gets the recorded call with the same name and input, else the first of that name.
+        if tool_use["toolUseId"] in self.tool_calls:
+            return self.tool_calls[tool_use["toolUseId"]]
+        same_name = [call for call in self.tool_calls.values() if call["name"] == tool_use["name"]]
+        for call in same_name:
+            if call["input"] == tool_use.get("input"):
+                return call
+        return same_name[0] if same_name else None
+
+
+class ReplayModel(Model):
+    """Streams the recorded model events of the current replay turn.
+
+    `time_scale` stretches the recorded gaps between events: 1 replays them as recorded,
+    0.1 ten times faster, 0 without waiting.
+    """
+
+    def __init__(self, time_scale: float = 1.0):
+        self.time_scale = time_scale
+        self.config: Dict[str, Any] = {"model_id": "replay"}
+
+    def update_config(self, **model_config: Any) -> None:
+        self.config.update(model_config)
+
+    def get_config(self) -> Dict[str, Any]:
+        return self.config
+
+    async def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        raise NotImplementedError("structured output is not recorded")
+        yield
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs: Any) -> AsyncIterable[Dict[str, Any]]:
+        turn = current_turn.get()
+        if not isinstance(turn, ReplayTurn):
+            raise RuntimeError("no replay turn is active for this model call")
+        for gap_ms, event in turn.next_model_call()["events"]:
+            if self.time_scale and gap_ms:
+                await asyncio.sleep(gap_ms / 1000 * self.time_scale)
+            yield event
+
+
+class ReplayTool(AgentTool):
+    """Tool with a recorded spec that answers with the recorded result of the current replay turn."""
+
+    def __init__(self, spec: Dict[str, Any], replayer: "TurnReplayer"):
+        super().__init__()
+        self._spec = spec
+        self._replayer = replayer
+
+    @property
+    def tool_name(self) -> str:
+        return self._spec["name"]
+
+    @property
+    def tool_spec(self):
+        return self._spec
+
+    @property
+    def tool_type(self) -> str:
+        return "replay"
+
+    async def stream(self, tool_use: ToolUse, invocation_state: Dict[str, Any], **kwargs: Any) -> ToolGenerator:
+        turn = current_turn.get()
+        call = turn.tool_call(tool_use) if isinstance(turn, ReplayTurn) else None
+        if call is None or "result" not in call:
+            yield {"toolUseId": tool_use["toolUseId"], "status": "error",
+                   "content": [{"text": f"no recorded result for {self.tool_name}"}]}
+            return
+        if self._replayer.time_scale:
+            await asyncio.sleep(call["duration_ms"] / 1000 * self._replayer.time_scale)
+        yield {**call["result"], "toolUseId": tool_use["toolUseId"]}
+
+
+class TurnReplayer:
+    """Serves chat turns from recorded traces.
+
+    Turns are matched to traces by query, in recording order, so a driver that sends the
+    recorded queries in order gets each trace once. `reset()` starts over.
+    """
+
+    def __init__(self, traces: List[Dict[str, Any]], time_scale: float = 1.0):
+        self.traces = traces
+        self.model = ReplayModel(time_scale)
+        self._pending: Dict[str, deque] = {}
+        self.reset()
+
+    @property
+    def time_scale(self) -> float:
+        return self.model.time_scale
+
+    @time_scale.setter
+    def time_scale(self, value: float) -> None:
+        self.model.time_scale = value
+
+    def reset(self) -> None:
+        self._pending = defaultdict(deque)
+        for trace in self.traces:
+            self._pending[trace["query"]].append(trace)
+
+    def tools(self) -> List[ReplayTool]:
+        specs = {}
+        for trace in self.traces:
+            for spec in trace.get("tool_specs") or []:
+                specs[spec["name"]] = spec
+        return [ReplayTool(spec, self) for spec in specs.values()]
+
+    def tool_classes(self) -> Dict[str, str]:
+        """Tool classes seen while recording, so replayed tools get the same concurrency limits."""
+        classes = {}
+        for trace in self.traces:
+            classes.update(trace.get("tool_classes") or {})
+        return classes
+
+    @contextmanager
+    def turn(self, query: str) -> Iterator[None]:
+        if not self._pending.get(query):
+            raise LookupError(f"no recorded turn left for query {query!r}")
+        with _as_current_turn(ReplayTurn(self._pending[query].popleft())):
+            yield
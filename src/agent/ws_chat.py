@@ -0,0 +1,151 @@
+## Multiplexed WebSocket chat
+# One socket carries any number of concurrent chat turns, across sessions. Every frame is JSON.
+#
+# client -> server
+#   {"type": "chat", "request_id": "r1", "session_id": "s1", "query": "...", "prefetch_kb": null}
+#   {"type": "credit", "request_id": "r1", "credit": 64}     allow 64 more event frames for r1
+#   {"type": "cancel", "request_id": "r1"}
+#
+# server -> client
+#   {"type": "event", "request_id": "r1", "session_id": "s1", "event": "message" | "tool", "data": {...}}
+#   {"type": "done" | "cancelled", "request_id": "r1", "session_id": "s1"}
+#   {"type": "error", "request_id": "r1", "session_id": "s1", "detail": "..."}
+#
+# `data` is the same SSEMessageData / SSEToolData payload as /stream_chat sends. Each stream
+# starts with `initial_credit` event frames and pauses when its credit runs out, so a slow
+# consumer of one conversation does not hold back the others. A socket runs at most
+# `max_streams` turns at once. Frames that cannot be served (binary, not JSON, unknown
+# request_id, ...) get an error frame and the socket stays open.
+
+import asyncio
+import json
+import logging
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+
+from fastapi import WebSocket
+from pydantic import BaseModel, Field, ValidationError
+
+from chat_events import SESSION_ID_PATTERN
+
+logger = logging.getLogger(__name__)
+
+
+class WSClientFrame(BaseModel):
+    """Frame sent by the client."""
+    type: str = Field(..., description="chat, credit or cancel")
+    request_id: str = Field(..., min_length=1)
+    session_id: str = Field(default="test", pattern=SESSION_ID_PATTERN)
+    query: Optional[str] = Field(default=None, min_length=1)
+    prefetch_kb: Optional[bool] = None
+    credit: int = Field(default=0, ge=0)
+
+
+class WSStream:
+    """Server side state of one chat turn on the socket."""
+
+    def __init__(self, frame: WSClientFrame, credit: int):
+        self.request_id = frame.request_id
+        self.session_id = frame.session_id
+        self.credit = credit
+        self.credit_available = asyncio.Event()
+        if credit > 0:
+            self.credit_available.set()
+        self.task: Optional[asyncio.Task] = None
+
+    def add_credit(self, credit: int) -> None:
+        self.credit += credit
+        if self.credit > 0:
+            self.credit_available.set()
+
+    async def take_credit(self) -> None:
+        while self.credit <= 0:
+            self.credit_available.clear()
+            await self.credit_available.wait()
+        self.credit -= 1
+
+
+async def serve_chat_socket(websocket: WebSocket, run_turn: Callable[[str, str, Optional[bool]], AsyncIterator[Any]],
+                            initial_credit: int = 64, max_streams: int = 16) -> None:
+    """Accept the websocket and run the multiplexed chat protocol until it closes.
+
+    `run_turn(session_id, query, prefetch_kb)` yields SSEMessageEvent / SSEToolEvent models.
+    """
+    await websocket.accept()
+    streams: Dict[str, WSStream] = {}
+    send_lock = asyncio.Lock()
+
+    async def send(payload: Dict[str, Any]) -> None:
+        async with send_lock:
+            await websocket.send_json(payload)
+
+    async def run_stream(stream: WSStream, query: str, prefetch_kb: Optional[bool]) -> None:
+        tags = {"request_id": stream.request_id, "session_id": stream.session_id}
+        try:
+            # aclosing: a cancel while waiting on credit or send closes the turn right here, in this task's context
+            async with aclosing(run_turn(stream.session_id, query, prefetch_kb)) as chat_events:
+                async for chat_event in chat_events:
+                    await stream.take_credit()
+                    await send({"type": "event", **tags, "event": chat_event.event, "data": chat_event.data.dict()})
+            await send({"type": "done", **tags})
+        except asyncio.CancelledError:
+            try:
+                await send({"type": "cancelled", **tags})
+            except Exception:
+                pass  # socket already gone
+            raise
+        except Exception as e:
+            logger.exception(f"ws stream {stream.request_id} failed")
+            await send({"type": "error", **tags, "detail": str(e)})
+        finally:
+            streams.pop(stream.request_id, None)
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                logger.info(f"websocket closed with {len(streams)} streams in flight")
+                break
+            if message.get("text") is None:
+                await send({"type": "error", "request_id": None, "detail": "invalid frame: frames must be JSON text"})
+                continue
+
+            raw = None
+            try:
+                raw = json.loads(message["text"])
+                frame = WSClientFrame(**raw)
+            except (json.JSONDecodeError, ValidationError, TypeError) as e:
+                await send({"type": "error", "request_id": raw.get("request_id") if isinstance(raw, dict) else None,
+                            "detail": f"invalid frame: {e}"})
+                continue
+
+            error = None
+            if frame.type == "chat":
+                if frame.request_id in streams:
+                    error = "request_id already in use"
+                elif not frame.query:
+                    error = "query is required"
+                elif len(streams) >= max_streams:
+                    error = f"too many streams on this socket, at most {max_streams} run at once"
+                else:
+                    stream = WSStream(frame, credit=initial_credit)
+                    streams[frame.request_id] = stream
+                    stream.task = asyncio.create_task(run_stream(stream, frame.query, frame.prefetch_kb))
+
+            elif frame.type in ("credit", "cancel"):
+                if frame.request_id not in streams:
+                    error = "unknown request_id"
+                elif frame.type == "credit":
+                    streams[frame.request_id].add_credit(frame.credit)
+                else:
+                    streams[frame.request_id].task.cancel()
+
+            else:
+                error = f"unknown frame type {frame.type!r}"
+
+            if error:
+                await send({"type": "error", "request_id": frame.request_id, "session_id": frame.session_id, "detail": error})
+
+    finally:
+        for stream in list(streams.values()):
+            stream.task.cancel()
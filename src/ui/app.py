@@ -522,8 +522,8 @@ def display_tool_box(tool_data: Dict[str, Any]):
     
     st.markdown(tool_box_html, unsafe_allow_html=True)
     
-    # Add expandable section for completed tools
-    if state == "done" and tool_input:
+    # Add expandable section for finished tools
+    if state in ("done", "error", "timeout") and tool_input:
         display_expandable_tool_input(tool_use_id, tool_input)
 
 def display_expandable_tool_input(tool_use_id: str, tool_input: Dict[str, Any]):
@@ -550,10 +550,16 @@ def get_state_indicator(state: str) -> str:
     """Get state indicator for tool"""
     if state == "in-progress":
         return "⏳ In Progress..."
+    elif state == "queued":
+        return "🕒 Queued"
+    elif state == "running":
+        return "⚙️ Running..."
     elif state == "done":
         return "✅ Done"
     elif state == "error":
         return "❌ Error"
+    elif state == "timeout":
+        return "⌛ Timed Out"
     else:
         return "❓ Unknown"
 